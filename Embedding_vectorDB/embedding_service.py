@@ -20,26 +20,26 @@ class EmbeddingService:
         self.embedding_dim = 768
         print(f"Model loaded successfully. Embedding dimension: {self.embedding_dim}")
 
-    def get_embedding(self, text: str) -> List[float]:
-        """Generate embedding for input text"""
+    def get_embedding(self, text: str) -> np.ndarray:
+        """Generate embedding for input text (float32 array, passed to Milvus without re-boxing)"""
         try:
             # Clean text
             text = text.strip()
             if not text:
-                return [0.0] * self.embedding_dim
+                return np.zeros(self.embedding_dim, dtype=np.float32)
 
             # Generate embedding
             with torch.no_grad():
                 embedding = self.model.encode(text, convert_to_tensor=True)
                 embedding = embedding.cpu().numpy()
 
-            return embedding.tolist()
+            return embedding.astype(np.float32, copy=False)
 
         except Exception as e:
             print(f"Embedding error: {e}")
-            return [0.0] * self.embedding_dim
+            return np.zeros(self.embedding_dim, dtype=np.float32)
 
-    def get_batch_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def get_batch_embeddings(self, texts: List[str]) -> List[np.ndarray]:
         """Generate embeddings for multiple texts"""
         embeddings = []
         for text in texts:
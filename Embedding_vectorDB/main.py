@@ -10,12 +10,26 @@ import random
 import time
 from typing import List, Dict, Any
 import json
+import logging
+import logging.handlers
+import queue
 
 # Import processing modules
 from document_processor import DocumentProcessor
 from embedding_service import EmbeddingService
 from milvus_client import MilvusManager
 
+# Logging goes through a queue: handlers do their I/O on a listener thread,
+# so log calls on request paths never block the event loop
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.handlers.QueueHandler(log_queue)]
+)
+log_listener.start()
+
 app = FastAPI(
     title="Document Processing API",
     version="1.0.0",
@@ -80,6 +94,17 @@ def get_safe_temp_filename(original_filename: str) -> str:
     return safe_name
 
 
+def make_faq_id(faq_id: str) -> str:
+    """
+    Generate FAQ ID if not provided, otherwise sanitize it
+    """
+    if not faq_id:
+        return f"faq_{str(uuid.uuid4())[:8]}"
+
+    faq_id = re.sub(r'[^\w\-_.]', '_', str(faq_id))
+    return re.sub(r'_+', '_', faq_id).strip('_')
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize Milvus connection and create collections"""
@@ -91,6 +116,12 @@ async def startup_event():
         print(f"⚠️  Warning during startup: {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush queued log records"""
+    log_listener.stop()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -102,8 +133,11 @@ async def root():
             "process_document": "/api/v1/process-document",
             "embed_markdown": "/api/v1/embed-markdown",
             "add_faq": "/api/v1/faq/add",
+            "add_faq_bulk": "/api/v1/faq/add_bulk",
             "delete_faq": "/api/v1/faq/delete/{faq_id}",
+            "delete_faq_bulk": "/api/v1/faq/delete_bulk",
             "delete_document": "/api/v1/document/delete/{document_id}",
+            "delete_document_bulk": "/api/v1/document/delete_bulk",
             "health": "/api/v1/health"
         }
     }
@@ -365,12 +399,7 @@ async def add_faq(request: dict):
             raise HTTPException(status_code=400, detail="Answer is required")
 
         # Generate FAQ ID if not provided
-        if not faq_id:
-            faq_id = f"faq_{str(uuid.uuid4())[:8]}"
-        else:
-            # Sanitize FAQ ID
-            faq_id = re.sub(r'[^\w\-_.]', '_', str(faq_id))
-            faq_id = re.sub(r'_+', '_', faq_id).strip('_')
+        faq_id = make_faq_id(faq_id)
 
         # Generate embedding for the question
         question_embedding = embedding_service.get_embedding(question)
@@ -395,6 +424,67 @@ async def add_faq(request: dict):
         )
 
 
+@app.post("/api/v1/faq/add_bulk")
+async def add_faq_bulk(request: dict):
+    """
+    API 4b: Add FAQ bulk - Thêm nhiều FAQ trong một request (một lần insert + flush)
+    Input: {"items": [{"question": "...", "answer": "...", "faq_id": "optional_id"}, ...]}
+    Returns: Kết quả từng FAQ theo đúng thứ tự input
+    """
+    try:
+        items = request.get("items")
+        if not isinstance(items, list) or not items:
+            raise HTTPException(status_code=400, detail="items must be a non-empty list")
+
+        results = []
+        valid = []
+        for item in items:
+            question = (item.get("question") or "").strip()
+            answer = (item.get("answer") or "").strip()
+
+            if not question:
+                results.append({"status": "error", "detail": "Question is required"})
+                continue
+            if not answer:
+                results.append({"status": "error", "question": question, "detail": "Answer is required"})
+                continue
+
+            entry = {
+                "status": "success",
+                "faq_id": make_faq_id((item.get("faq_id") or "").strip()),
+                "question": question,
+                "answer": answer
+            }
+            results.append(entry)
+            valid.append(entry)
+
+        if valid:
+            question_embeddings = embedding_service.get_batch_embeddings([e["question"] for e in valid])
+            inserted = await milvus_manager.insert_faqs(
+                [e["faq_id"] for e in valid],
+                [e["question"] for e in valid],
+                [e["answer"] for e in valid],
+                question_embeddings
+            )
+            if inserted != len(valid):
+                raise HTTPException(status_code=500, detail=f"Inserted {inserted}/{len(valid)} FAQs")
+
+        return {
+            "status": "success",
+            "added_count": len(valid),
+            "results": results,
+            "message": "FAQs added successfully"
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Add FAQ bulk error: {str(e)}"
+        )
+
+
 @app.delete("/api/v1/faq/delete/{faq_id}")
 async def delete_faq(faq_id: str):
     """
@@ -426,6 +516,37 @@ async def delete_faq(faq_id: str):
         )
 
 
+@app.post("/api/v1/faq/delete_bulk")
+async def delete_faq_bulk(request: dict):
+    """
+    API 5b: Delete FAQ bulk - Xóa nhiều FAQ bằng một biểu thức delete
+    Input: {"faq_ids": ["id1", "id2", ...]}
+    Returns: Success response
+    """
+    try:
+        faq_ids = [str(faq_id).strip() for faq_id in request.get("faq_ids") or [] if str(faq_id).strip()]
+        if not faq_ids:
+            raise HTTPException(status_code=400, detail="faq_ids is required")
+
+        success = await milvus_manager.delete_faqs(faq_ids)
+        if not success:
+            raise HTTPException(status_code=500, detail="Delete FAQ bulk failed")
+
+        return {
+            "status": "success",
+            "faq_ids": faq_ids,
+            "message": "FAQs deleted successfully"
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Delete FAQ bulk error: {str(e)}"
+        )
+
+
 @app.delete("/api/v1/document/delete/{document_id}")
 async def delete_document(document_id: str):
     """
@@ -457,6 +578,37 @@ async def delete_document(document_id: str):
         )
 
 
+@app.post("/api/v1/document/delete_bulk")
+async def delete_document_bulk(request: dict):
+    """
+    API 6b: Delete Document bulk - Xóa embeddings của nhiều document_id
+    Input: {"document_ids": ["doc1", "doc2", ...]}
+    Returns: Success response
+    """
+    try:
+        document_ids = [str(doc_id).strip() for doc_id in request.get("document_ids") or [] if str(doc_id).strip()]
+        if not document_ids:
+            raise HTTPException(status_code=400, detail="document_ids is required")
+
+        success = await milvus_manager.delete_documents(document_ids)
+        if not success:
+            raise HTTPException(status_code=500, detail="Delete document bulk failed")
+
+        return {
+            "status": "success",
+            "document_ids": document_ids,
+            "message": "Documents and all their embeddings deleted successfully"
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Delete document bulk error: {str(e)}"
+        )
+
+
 @app.get("/api/v1/health")
 async def health_check():
     """Health check endpoint"""
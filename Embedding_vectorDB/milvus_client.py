@@ -1,11 +1,48 @@
 from pymilvus import connections, Collection, FieldSchema, CollectionSchema, DataType, utility
 from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import numpy as np
+import hashlib
 import asyncio
+import logging
 import uuid
 import time
 
+logger = logging.getLogger(__name__)
+
+# Optional SIMD kernels for exact client-side rerank (falls back to NumPy/BLAS)
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
+# gRPC channel options for the Milvus connection: gzip-compress RPCs so large
+# insert batches (long descriptions) go over the wire compressed
+GRPC_OPTIONS = [
+    ("grpc.default_compression_algorithm", 2),  # 2 = gzip
+]
+
+
+def cosine_scores(query, candidates) -> np.ndarray:
+    """Exact cosine similarity of one query vector against (N, dim) candidate vectors"""
+    query = np.asarray(query, dtype=np.float32)
+    candidates = np.asarray(candidates, dtype=np.float32)
+    if candidates.size == 0:
+        return np.empty(0, dtype=np.float32)
+
+    if simsimd is not None:
+        distances = simsimd.cdist(query[np.newaxis, :], candidates, metric="cosine")
+        return 1.0 - np.asarray(distances, dtype=np.float32).ravel()
+
+    norms = np.linalg.norm(candidates, axis=1) * np.linalg.norm(query) + 1e-12
+    return (candidates @ query) / norms
+
 
 class MilvusManager:
+    # Collection handles shared by all managers in the process (keyed by name)
+    _collections: Dict[str, Collection] = {}
+
     def __init__(self, host: str = "localhost", port: str = "19530"):
         self.host = host
         self.port = port
@@ -17,6 +54,26 @@ class MilvusManager:
 
         self.embedding_dim = 768
 
+        # Shards spread inserts/scans over data nodes; document_id is the
+        # partition key so per-document deletes touch a single partition
+        self.num_shards = 4
+
+        # FAQ search is high-QPS with a small limit: an 8-bit scalar-quantized
+        # index (IVF_SQ8) keeps 4x less vector data in memory at ~same recall
+        self.faq_index_type = "IVF_SQ8"
+        self._faq_search_params = {"nprobe": 16}
+
+        # Document search is the RAG retrieval hot path: an HNSW graph probes far
+        # fewer vectors than IVF_FLAT at the same recall. ef is raised to >= limit.
+        self.document_index_params = {"index_type": "HNSW", "params": {"M": 24, "efConstruction": 128}}
+        self.hnsw_ef = 100
+        self._document_search_params = {"ef": self.hnsw_ef}
+
+        # Vectors are L2-normalized on write, so inner product == cosine.
+        # Collections created before that keep the metric of their index.
+        self.metric_type = "IP"
+        self.metric_types = {self.collection_name: self.metric_type, self.faq_collection_name: self.metric_type}
+
         # Field length limits
         self.max_id_length = 190
         self.max_document_id_length = 90
@@ -24,39 +81,155 @@ class MilvusManager:
         self.max_question_length = 60000
         self.max_answer_length = 60000
 
+        # pymilvus is blocking gRPC - run every call in a worker pool
+        self._pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="Milvus-Worker")
+
+        # Search result cache (LRU + TTL). Writes bump the collection version,
+        # so entries cached before an insert/delete are never served again.
+        self.search_cache_size = 10_000
+        self.search_cache_ttl = 300
+        self._search_cache = OrderedDict()
+        self._cache_versions = {self.collection_name: 0, self.faq_collection_name: 0}
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+    async def _run(self, fn, *args, **kwargs):
+        """Run a blocking pymilvus call off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, lambda: fn(*args, **kwargs))
+
     async def initialize(self, max_retries: int = 5, retry_delay: int = 2):
         """Initialize Milvus connection and create collections with retry logic"""
         for attempt in range(max_retries):
             try:
-                print(
-                    f"Attempting to connect to Milvus at {self.host}:{self.port} (attempt {attempt + 1}/{max_retries})")
-
-                # Close existing connection if any
-                try:
-                    connections.disconnect("default")
-                except:
-                    pass
-
-                connections.connect("default", host=self.host, port=self.port)
-                print(f"✅ Connected to Milvus at {self.host}:{self.port}")
+                logger.info("Attempting to connect to Milvus at %s:%s (attempt %d/%d)",
+                            self.host, self.port, attempt + 1, max_retries)
+
+                # Reuse the process-wide connection; only reset it when retrying
+                if attempt > 0:
+                    try:
+                        await self._run(connections.disconnect, "default")
+                    except:
+                        pass
+                    MilvusManager._collections.clear()
+
+                if not connections.has_connection("default"):
+                    await self._run(
+                        connections.connect, "default", host=self.host, port=self.port, grpc_options=GRPC_OPTIONS
+                    )
+                    logger.info("✅ Connected to Milvus at %s:%s", self.host, self.port)
+                else:
+                    logger.info("✅ Reusing Milvus connection to %s:%s", self.host, self.port)
 
                 await self.create_collection()
                 await self.create_faq_collection()
 
                 self.is_initialized = True
-                print("✅ Milvus initialization completed successfully")
+                logger.info("✅ Milvus initialization completed successfully")
                 return True
 
             except Exception as e:
-                print(f"❌ Milvus initialization error (attempt {attempt + 1}/{max_retries}): {e}")
+                logger.error("❌ Milvus initialization error (attempt %d/%d): %s", attempt + 1, max_retries, e)
                 if attempt < max_retries - 1:
-                    print(f"Retrying in {retry_delay} seconds...")
+                    logger.info("Retrying in %s seconds...", retry_delay)
                     await asyncio.sleep(retry_delay)
                 else:
-                    print(f"❌ Failed to initialize Milvus after {max_retries} attempts")
+                    logger.error("❌ Failed to initialize Milvus after %d attempts", max_retries)
                     self.is_initialized = False
                     raise e
 
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        """L2-normalize vector(s) so that inner product equals cosine similarity"""
+        arr = np.asarray(vectors, dtype=np.float32)
+        return arr / (np.linalg.norm(arr, axis=-1, keepdims=True) + 1e-12)
+
+    async def _get_collection(self, name: str) -> Collection:
+        """Get a shared Collection handle, creating it once per process"""
+        collection = MilvusManager._collections.get(name)
+        if collection is None:
+            collection = await self._run(Collection, name)
+            MilvusManager._collections[name] = collection
+        return collection
+
+    async def _detect_metric_type(self, collection: Collection) -> str:
+        """Read metric type from the vector index of an existing collection"""
+        try:
+            indexes = await self._run(lambda: collection.indexes)
+            for index in indexes:
+                metric_type = index.params.get("metric_type")
+                if metric_type:
+                    return metric_type
+        except Exception as e:
+            logger.warning("Could not read index metric type of %s: %s", collection.name, e)
+        return self.metric_type
+
+    async def _detect_index_type(self, collection: Collection) -> str:
+        """Read index type from the vector index of an existing collection"""
+        try:
+            indexes = await self._run(lambda: collection.indexes)
+            for index in indexes:
+                index_type = index.params.get("index_type")
+                if index_type:
+                    return index_type
+        except Exception as e:
+            logger.warning("Could not read index type of %s: %s", collection.name, e)
+        return self.document_index_params["index_type"]
+
+    def _search_params_for(self, index_type: str) -> Dict[str, Any]:
+        """Search params matching the index type (collections built before HNSW keep IVF)"""
+        if index_type == "HNSW":
+            return {"ef": self.hnsw_ef}
+        return {"nprobe": 10}
+
+    @staticmethod
+    def _vector_digest(vector) -> bytes:
+        """Hash a vector's float32 bytes"""
+        return hashlib.blake2b(np.asarray(vector, dtype=np.float32).tobytes(), digest_size=16).digest()
+
+    def _search_cache_key(self, collection_name: str, query_vector: List[float], limit: int,
+                          min_score: float, rerank_with=None) -> tuple:
+        """Build cache key from query vector hash + search params"""
+        rerank_digest = None if rerank_with is None else self._vector_digest(rerank_with)
+        return (collection_name, self._cache_versions[collection_name], self._vector_digest(query_vector),
+                limit, round(min_score, 3), rerank_digest)
+
+    def _get_cached_search(self, key: tuple):
+        """Return a copy of cached search results, or None on miss/expiry"""
+        entry = self._search_cache.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            del self._search_cache[key]
+            entry = None
+
+        if entry is None:
+            self._cache_misses += 1
+            return None
+
+        self._search_cache.move_to_end(key)
+        self._cache_hits += 1
+        return [dict(item) for item in entry[1]]
+
+    def _store_cached_search(self, key: tuple, results: List[Dict]):
+        """Store search results, evicting least recently used entries"""
+        self._search_cache[key] = (time.monotonic() + self.search_cache_ttl, [dict(item) for item in results])
+        self._search_cache.move_to_end(key)
+        while len(self._search_cache) > self.search_cache_size:
+            self._search_cache.popitem(last=False)
+
+    def _invalidate_search_cache(self, collection_name: str):
+        """Invalidate cached searches of a collection after a write"""
+        self._cache_versions[collection_name] += 1
+
+    def cache_info(self) -> Dict[str, Any]:
+        """Get search cache statistics"""
+        return {
+            "hits": self._cache_hits,
+            "misses": self._cache_misses,
+            "size": len(self._search_cache),
+            "maxsize": self.search_cache_size,
+            "ttl_seconds": self.search_cache_ttl
+        }
+
     def _check_initialized(self):
         """Check if Milvus is initialized, raise exception if not"""
         if not self.is_initialized:
@@ -66,30 +239,32 @@ class MilvusManager:
             )
 
     def _validate_and_truncate(self, data: Dict[str, Any], field_limits: Dict[str, int]) -> Dict[str, Any]:
-        """Validate and truncate fields to fit Milvus limits"""
-        validated = data.copy()
-
+        """Validate and truncate fields to fit Milvus limits (in place - callers don't reuse the input)"""
         for field, max_length in field_limits.items():
-            if field in validated and isinstance(validated[field], str):
-                if len(validated[field]) > max_length:
-                    print(f"Warning: Truncating {field} from {len(validated[field])} to {max_length} chars")
-                    validated[field] = validated[field][:max_length - 3] + "..."
+            value = data.get(field)
+            if isinstance(value, str) and len(value) > max_length:
+                logger.warning("Truncating %s from %d to %d chars", field, len(value), max_length)
+                data[field] = value[:max_length - 3] + "..."
 
-        return validated
+        return data
 
     async def create_collection(self):
         """Create collection with 768D vectors"""
         try:
-            if utility.has_collection(self.collection_name):
-                print(f"Collection {self.collection_name} already exists")
-                self.collection = Collection(self.collection_name)
-                self.collection.load()
-                print(f"✅ Loaded existing collection {self.collection_name}")
+            if await self._run(utility.has_collection, self.collection_name):
+                logger.info("Collection %s already exists", self.collection_name)
+                self.collection = await self._get_collection(self.collection_name)
+                self.metric_types[self.collection_name] = await self._detect_metric_type(self.collection)
+                self._document_search_params = self._search_params_for(
+                    await self._detect_index_type(self.collection)
+                )
+                await self._run(self.collection.load)
+                logger.info("✅ Loaded existing collection %s", self.collection_name)
                 return
 
             fields = [
                 FieldSchema(name="id", dtype=DataType.VARCHAR, max_length=200, is_primary=True),
-                FieldSchema(name="document_id", dtype=DataType.VARCHAR, max_length=100),
+                FieldSchema(name="document_id", dtype=DataType.VARCHAR, max_length=100, is_partition_key=True),
                 FieldSchema(name="description", dtype=DataType.VARCHAR, max_length=65000),
                 FieldSchema(name="description_vector", dtype=DataType.FLOAT_VECTOR, dim=768)
             ]
@@ -99,39 +274,44 @@ class MilvusManager:
                 description="Document embeddings collection (768D)"
             )
 
-            self.collection = Collection(
+            self.collection = await self._run(
+                Collection,
                 name=self.collection_name,
                 schema=schema,
-                using='default'
+                using='default',
+                num_shards=self.num_shards
             )
+            MilvusManager._collections[self.collection_name] = self.collection
 
             # Create index
             index_params = {
-                "metric_type": "COSINE",
-                "index_type": "IVF_FLAT",
-                "params": {"nlist": 1024}
+                "metric_type": self.metric_type,
+                **self.document_index_params
             }
 
-            self.collection.create_index(
+            await self._run(
+                self.collection.create_index,
                 field_name="description_vector",
                 index_params=index_params
             )
+            self._document_search_params = self._search_params_for(index_params["index_type"])
 
-            self.collection.load()
-            print(f"✅ Collection {self.collection_name} created and loaded successfully with 768D vectors")
+            await self._run(self.collection.load)
+            logger.info("✅ Collection %s created and loaded successfully with 768D vectors", self.collection_name)
 
         except Exception as e:
-            print(f"❌ Collection creation error: {e}")
+            logger.error("❌ Collection creation error: %s", e)
             raise e
 
     async def create_faq_collection(self):
         """Create FAQ collection with 768D vectors"""
         try:
-            if utility.has_collection(self.faq_collection_name):
-                print(f"Collection {self.faq_collection_name} already exists")
-                self.faq_collection = Collection(self.faq_collection_name)
-                self.faq_collection.load()
-                print(f"✅ Loaded existing collection {self.faq_collection_name}")
+            if await self._run(utility.has_collection, self.faq_collection_name):
+                logger.info("Collection %s already exists", self.faq_collection_name)
+                self.faq_collection = await self._get_collection(self.faq_collection_name)
+                self.metric_types[self.faq_collection_name] = await self._detect_metric_type(self.faq_collection)
+                await self._run(self.faq_collection.load)
+                logger.info("✅ Loaded existing collection %s", self.faq_collection_name)
                 return
 
             fields = [
@@ -146,29 +326,33 @@ class MilvusManager:
                 description="FAQ embeddings collection (768D)"
             )
 
-            self.faq_collection = Collection(
+            self.faq_collection = await self._run(
+                Collection,
                 name=self.faq_collection_name,
                 schema=schema,
-                using='default'
+                using='default',
+                num_shards=self.num_shards
             )
+            MilvusManager._collections[self.faq_collection_name] = self.faq_collection
 
             # Create index
             index_params = {
-                "metric_type": "COSINE",
-                "index_type": "IVF_FLAT",
+                "metric_type": self.metric_type,
+                "index_type": self.faq_index_type,
                 "params": {"nlist": 1024}
             }
 
-            self.faq_collection.create_index(
+            await self._run(
+                self.faq_collection.create_index,
                 field_name="question_vector",
                 index_params=index_params
             )
 
-            self.faq_collection.load()
-            print(f"✅ Collection {self.faq_collection_name} created and loaded successfully with 768D vectors")
+            await self._run(self.faq_collection.load)
+            logger.info("✅ Collection %s created and loaded successfully with 768D vectors", self.faq_collection_name)
 
         except Exception as e:
-            print(f"❌ FAQ Collection creation error: {e}")
+            logger.error("❌ FAQ Collection creation error: %s", e)
             raise e
 
     async def insert_embeddings(self, embeddings_data: List[Dict]) -> int:
@@ -182,9 +366,9 @@ class MilvusManager:
 
             # Ensure collection is loaded before insertion
             try:
-                self.collection.load()
+                await self._run(self.collection.load)
             except Exception as load_error:
-                print(f"Warning: Could not load collection: {load_error}")
+                logger.warning("Could not load collection: %s", load_error)
 
             if not embeddings_data:
                 return 0
@@ -195,36 +379,37 @@ class MilvusManager:
                 "description": self.max_description_length
             }
 
-            validated_data = []
+            # Build insert columns in a single pass
+            ids, document_ids, descriptions, vectors = [], [], [], []
             for item in embeddings_data:
                 if not all(key in item for key in ["id", "document_id", "description", "description_vector"]):
-                    print(f"Skipping item missing required fields: {item.keys()}")
+                    logger.warning("Skipping item missing required fields: %s", list(item.keys()))
                     continue
 
                 validated_item = self._validate_and_truncate(item, field_limits)
 
                 # Validate vector dimension = 768
                 if len(validated_item["description_vector"]) != self.embedding_dim:
-                    print(f"Skipping item with incorrect vector dimension: {len(validated_item['description_vector'])}")
+                    logger.warning("Skipping item with incorrect vector dimension: %d",
+                                   len(validated_item["description_vector"]))
                     continue
 
-                validated_data.append(validated_item)
+                ids.append(validated_item["id"])
+                document_ids.append(validated_item["document_id"])
+                descriptions.append(validated_item["description"])
+                vectors.append(validated_item["description_vector"])
 
-            if not validated_data:
-                print("No valid data to insert")
+            if not ids:
+                logger.warning("No valid data to insert")
                 return 0
 
-            # Prepare data for insertion
-            ids = [item["id"] for item in validated_data]
-            document_ids = [item["document_id"] for item in validated_data]
-            descriptions = [item["description"] for item in validated_data]
-            vectors = [item["description_vector"] for item in validated_data]
+            # Vector column as one (N, dim) float32 array - no per-float boxing on insert
+            vectors = self._normalize(vectors)
 
-            # Insert in batches
-            batch_size = 100
-            total_inserted = 0
+            # Insert in batches (fanned out concurrently over the worker pool)
+            batch_size = 500
 
-            for i in range(0, len(validated_data), batch_size):
+            async def insert_batch(i: int) -> int:
                 batch_ids = ids[i:i + batch_size]
                 batch_document_ids = document_ids[i:i + batch_size]
                 batch_descriptions = descriptions[i:i + batch_size]
@@ -233,20 +418,26 @@ class MilvusManager:
                 entities = [batch_ids, batch_document_ids, batch_descriptions, batch_vectors]
 
                 try:
-                    insert_result = self.collection.insert(entities)
-                    total_inserted += len(batch_ids)
-                    print(f"Inserted batch {i // batch_size + 1}: {len(batch_ids)} items")
+                    await self._run(self.collection.insert, entities)
+                    logger.debug("Inserted batch %d: %d items", i // batch_size + 1, len(batch_ids))
+                    return len(batch_ids)
                 except Exception as batch_error:
-                    print(f"Error inserting batch {i // batch_size + 1}: {batch_error}")
-                    continue
+                    logger.error("Error inserting batch %d: %s", i // batch_size + 1, batch_error)
+                    return 0
+
+            inserted_counts = await asyncio.gather(
+                *(insert_batch(i) for i in range(0, len(ids), batch_size))
+            )
+            total_inserted = sum(inserted_counts)
 
             # Flush after insertion to persist data
-            self.collection.flush()
-            print(f"✅ Total inserted: {total_inserted} embeddings")
+            await self._run(self.collection.flush)
+            self._invalidate_search_cache(self.collection_name)
+            logger.info("✅ Total inserted: %d embeddings", total_inserted)
             return total_inserted
 
         except Exception as e:
-            print(f"❌ Insert error: {e}")
+            logger.error("❌ Insert error: %s", e)
             raise e
 
     async def insert_faq(self, faq_id: str, question: str, answer: str, question_vector: List[float]) -> bool:
@@ -259,9 +450,9 @@ class MilvusManager:
 
             # Ensure collection is loaded
             try:
-                self.faq_collection.load()
+                await self._run(self.faq_collection.load)
             except Exception as load_error:
-                print(f"Warning: Could not load FAQ collection: {load_error}")
+                logger.warning("Could not load FAQ collection: %s", load_error)
 
             if len(faq_id) > 90:
                 faq_id = faq_id[:90]
@@ -272,20 +463,63 @@ class MilvusManager:
 
             # Validate 768D
             if len(question_vector) != self.embedding_dim:
-                print(f"Invalid vector dimension: {len(question_vector)}")
+                logger.warning("Invalid vector dimension: %d", len(question_vector))
                 return False
 
-            entities = [[faq_id], [question], [answer], [question_vector]]
-            insert_result = self.faq_collection.insert(entities)
-            self.faq_collection.flush()
+            entities = [[faq_id], [question], [answer], [self._normalize(question_vector)]]
+            await self._run(self.faq_collection.insert, entities)
+            await self._run(self.faq_collection.flush)
+            self._invalidate_search_cache(self.faq_collection_name)
 
-            print(f"✅ Inserted FAQ with id: {faq_id}")
+            logger.info("✅ Inserted FAQ with id: %s", faq_id)
             return True
 
         except Exception as e:
-            print(f"❌ FAQ Insert error: {e}")
+            logger.error("❌ FAQ Insert error: %s", e)
             return False
 
+    async def insert_faqs(self, faq_ids: List[str], questions: List[str], answers: List[str],
+                          question_vectors: List[np.ndarray]) -> int:
+        """Insert many FAQs with a single insert + flush"""
+        try:
+            self._check_initialized()
+
+            if not self.faq_collection:
+                raise Exception("FAQ Collection not initialized")
+
+            try:
+                await self._run(self.faq_collection.load)
+            except Exception as load_error:
+                logger.warning("Could not load FAQ collection: %s", load_error)
+
+            ids, qs, ans, vectors = [], [], [], []
+            for faq_id, question, answer, vector in zip(faq_ids, questions, answers, question_vectors):
+                if len(vector) != self.embedding_dim:
+                    logger.warning("Skipping FAQ %s with invalid vector dimension: %d", faq_id, len(vector))
+                    continue
+                if len(question) > self.max_question_length:
+                    question = question[:self.max_question_length - 3] + "..."
+                if len(answer) > self.max_answer_length:
+                    answer = answer[:self.max_answer_length - 3] + "..."
+                ids.append(faq_id[:90])
+                qs.append(question)
+                ans.append(answer)
+                vectors.append(vector)
+
+            if not ids:
+                return 0
+
+            await self._run(self.faq_collection.insert, [ids, qs, ans, self._normalize(vectors)])
+            await self._run(self.faq_collection.flush)
+            self._invalidate_search_cache(self.faq_collection_name)
+
+            logger.info("✅ Inserted %d FAQs", len(ids))
+            return len(ids)
+
+        except Exception as e:
+            logger.error("❌ FAQ bulk insert error: %s", e)
+            return 0
+
     async def delete_faq(self, faq_id: str) -> bool:
         """Delete FAQ by ID"""
         try:
@@ -295,17 +529,37 @@ class MilvusManager:
                 raise Exception("FAQ Collection not initialized")
 
             expr = f'faq_id == "{faq_id}"'
-            delete_result = self.faq_collection.delete(expr)
+            await self._run(self.faq_collection.delete, expr)
+            self._invalidate_search_cache(self.faq_collection_name)
+
+            logger.info("✅ Deleted FAQ with id: %s", faq_id)
+            return True
+
+        except Exception as e:
+            logger.error("❌ FAQ Delete error: %s", e)
+            return False
+
+    async def delete_faqs(self, faq_ids: List[str]) -> bool:
+        """Delete many FAQs with one delete expression"""
+        try:
+            self._check_initialized()
 
-            print(f"✅ Deleted FAQ with id: {faq_id}")
+            if not self.faq_collection:
+                raise Exception("FAQ Collection not initialized")
+
+            expr = "faq_id in [" + ", ".join(f'"{faq_id}"' for faq_id in faq_ids) + "]"
+            await self._run(self.faq_collection.delete, expr)
+            self._invalidate_search_cache(self.faq_collection_name)
+
+            logger.info("✅ Deleted %d FAQ ids", len(faq_ids))
             return True
 
         except Exception as e:
-            print(f"❌ FAQ Delete error: {e}")
+            logger.error("❌ FAQ bulk delete error: %s", e)
             return False
 
     async def delete_document(self, document_id: str) -> int:
-        """Delete all embeddings for a document"""
+        """Delete all embeddings for a document (collection có partition key trên document_id thì chỉ quét một partition; collection cũ quét toàn bộ)"""
         try:
             self._check_initialized()
 
@@ -313,17 +567,44 @@ class MilvusManager:
                 raise Exception("Collection not initialized")
 
             expr = f'document_id == "{document_id}"'
-            delete_result = self.collection.delete(expr)
+            await self._run(self.collection.delete, expr)
+            self._invalidate_search_cache(self.collection_name)
+
+            logger.info("✅ Deleted all embeddings for document_id: %s", document_id)
+            return True
+
+        except Exception as e:
+            logger.error("❌ Document Delete error: %s", e)
+            return False
+
+    async def delete_documents(self, document_ids: List[str]) -> bool:
+        """Delete all embeddings for many documents with one delete expression"""
+        try:
+            self._check_initialized()
+
+            if not self.collection:
+                raise Exception("Collection not initialized")
 
-            print(f"✅ Deleted all embeddings for document_id: {document_id}")
+            expr = "document_id in [" + ", ".join(f'"{doc_id}"' for doc_id in document_ids) + "]"
+            await self._run(self.collection.delete, expr)
+            self._invalidate_search_cache(self.collection_name)
+
+            logger.info("✅ Deleted all embeddings for %d documents", len(document_ids))
             return True
 
         except Exception as e:
-            print(f"❌ Document Delete error: {e}")
+            logger.error("❌ Document bulk delete error: %s", e)
             return False
 
-    async def search_similar(self, query_vector: List[float], limit: int = 10, min_score: float = 0.0) -> List[Dict]:
-        """Search for similar embeddings"""
+    async def search_similar(self, query_vector: List[float], limit: int = 10, min_score: float = 0.0,
+                             rerank_with: np.ndarray = None) -> List[Dict]:
+        """
+        Search for similar embeddings
+
+        If rerank_with (a query vector) is given, the ANN candidates are re-scored
+        locally with exact cosine against their stored vectors ("rerank_score")
+        and returned in that order.
+        """
         try:
             self._check_initialized()
 
@@ -331,39 +612,59 @@ class MilvusManager:
                 raise Exception("Collection not initialized")
 
             # Ensure collection is loaded before search
-            self.collection.load()
+            await self._run(self.collection.load)
 
             if len(query_vector) != self.embedding_dim:
                 raise Exception(f"Query vector dimension mismatch: {len(query_vector)} != {self.embedding_dim}")
 
+            query_vector = self._normalize(query_vector)
+            cache_key = self._search_cache_key(self.collection_name, query_vector, limit, min_score, rerank_with)
+            cached = self._get_cached_search(cache_key)
+            if cached is not None:
+                return cached
+
             search_params = {
-                "metric_type": "COSINE",
-                "params": {"nprobe": 10}
+                "metric_type": self.metric_types[self.collection_name],
+                "params": dict(self._document_search_params)
             }
-
-            results = self.collection.search(
+            if "ef" in search_params["params"]:
+                search_params["params"]["ef"] = max(search_params["params"]["ef"], limit)
+            if min_score > 0:
+                # Range search: Milvus drops hits below min_score server-side
+                search_params["params"]["radius"] = min_score
+
+            results = await self._run(
+                self.collection.search,
                 data=[query_vector],
                 anns_field="description_vector",
                 param=search_params,
                 limit=limit,
-                output_fields=["id", "document_id", "description"]
+                # primary key comes back as hit.id
+                output_fields=["document_id", "description"] + (["description_vector"] if rerank_with is not None else [])
             )
 
-            similar_docs = []
-            for hits in results:
-                for hit in hits:
-                    if hit.score >= min_score:
-                        similar_docs.append({
-                            "id": hit.entity.get("id"),
-                            "document_id": hit.entity.get("document_id"),
-                            "description": hit.entity.get("description"),
-                            "score": hit.score
-                        })
+            matched = [hit for hits in results for hit in hits if hit.score >= min_score]
+            similar_docs = [
+                {
+                    "id": hit.id,
+                    "document_id": hit.entity.get("document_id"),
+                    "description": hit.entity.get("description"),
+                    "score": hit.score
+                }
+                for hit in matched
+            ]
+
+            if rerank_with is not None and similar_docs:
+                scores = cosine_scores(rerank_with, [hit.entity.get("description_vector") for hit in matched])
+                for doc, score in zip(similar_docs, scores):
+                    doc["rerank_score"] = float(score)
+                similar_docs.sort(key=lambda doc: doc["rerank_score"], reverse=True)
 
+            self._store_cached_search(cache_key, similar_docs)
             return similar_docs
 
         except Exception as e:
-            print(f"❌ Search error: {e}")
+            logger.error("❌ Search error: %s", e)
             return []
 
     async def search_similar_faq(self, query_vector: List[float], limit: int = 10, min_score: float = 0.0) -> List[
@@ -376,39 +677,50 @@ class MilvusManager:
                 raise Exception("FAQ Collection not initialized")
 
             # Ensure collection is loaded before search
-            self.faq_collection.load()
+            await self._run(self.faq_collection.load)
 
             if len(query_vector) != self.embedding_dim:
                 raise Exception(f"Query vector dimension mismatch: {len(query_vector)} != {self.embedding_dim}")
 
+            query_vector = self._normalize(query_vector)
+            cache_key = self._search_cache_key(self.faq_collection_name, query_vector, limit, min_score)
+            cached = self._get_cached_search(cache_key)
+            if cached is not None:
+                return cached
+
             search_params = {
-                "metric_type": "COSINE",
-                "params": {"nprobe": 10}
+                "metric_type": self.metric_types[self.faq_collection_name],
+                "params": dict(self._faq_search_params)
             }
+            if min_score > 0:
+                # Range search: Milvus drops hits below min_score server-side
+                search_params["params"]["radius"] = min_score
 
-            results = self.faq_collection.search(
+            results = await self._run(
+                self.faq_collection.search,
                 data=[query_vector],
                 anns_field="question_vector",
                 param=search_params,
                 limit=limit,
-                output_fields=["faq_id", "question", "answer"]
+                output_fields=["question", "answer"]  # primary key comes back as hit.id
             )
 
-            similar_faqs = []
-            for hits in results:
-                for hit in hits:
-                    if hit.score >= min_score:
-                        similar_faqs.append({
-                            "faq_id": hit.entity.get("faq_id"),
-                            "question": hit.entity.get("question"),
-                            "answer": hit.entity.get("answer"),
-                            "score": hit.score
-                        })
+            similar_faqs = [
+                {
+                    "faq_id": hit.id,
+                    "question": hit.entity.get("question"),
+                    "answer": hit.entity.get("answer"),
+                    "score": hit.score
+                }
+                for hits in results for hit in hits
+                if hit.score >= min_score
+            ]
 
+            self._store_cached_search(cache_key, similar_faqs)
             return similar_faqs
 
         except Exception as e:
-            print(f"❌ FAQ Search error: {e}")
+            logger.error("❌ FAQ Search error: %s", e)
             return []
 
     async def get_collection_stats(self) -> Dict[str, Any]:
@@ -416,22 +728,22 @@ class MilvusManager:
         try:
             stats = {"initialized": self.is_initialized}
 
+            # num_entities reads persisted segment stats - no need to load the collection first
             if self.collection:
-                self.collection.load()
-                stats["document_count"] = self.collection.num_entities
+                stats["document_count"] = await self._run(lambda: self.collection.num_entities)
                 stats["document_collection_name"] = self.collection_name
                 stats["document_vector_dim"] = self.embedding_dim
 
             if self.faq_collection:
-                self.faq_collection.load()
-                stats["faq_count"] = self.faq_collection.num_entities
+                stats["faq_count"] = await self._run(lambda: self.faq_collection.num_entities)
                 stats["faq_collection_name"] = self.faq_collection_name
                 stats["faq_vector_dim"] = self.embedding_dim
 
+            stats["search_cache"] = self.cache_info()
             return stats
 
         except Exception as e:
-            print(f"❌ Stats error: {e}")
+            logger.error("❌ Stats error: %s", e)
             return {"error": str(e)}
 
     async def health_check(self) -> bool:
@@ -463,31 +775,33 @@ class MilvusManager:
                 raise Exception("Collection not initialized")
 
             # Release collection first
-            self.collection.release()
+            await self._run(self.collection.release)
 
             # Drop existing index
-            self.collection.drop_index()
+            await self._run(self.collection.drop_index)
 
-            # Create new index
+            # Create new index - giữ metric đã dùng: collection cũ lưu vector chưa chuẩn hóa
+            # theo COSINE, chuyển sang IP sẽ trả về dot product thô
             index_params = {
-                "metric_type": "COSINE",
-                "index_type": "IVF_FLAT",
-                "params": {"nlist": 1024}
+                "metric_type": self.metric_types[self.collection_name],
+                **self.document_index_params
             }
 
-            self.collection.create_index(
+            await self._run(
+                self.collection.create_index,
                 field_name="description_vector",
                 index_params=index_params
             )
 
+            self._document_search_params = self._search_params_for(index_params["index_type"])
+
             # Load collection
-            self.collection.load()
+            await self._run(self.collection.load)
 
-            print(f"Index rebuilt and collection loaded successfully")
-            print(f"Total entities: {self.collection.num_entities}")
+            logger.info("Index rebuilt and collection loaded successfully")
 
         except Exception as e:
-            print(f"Rebuild index error: {e}")
+            logger.error("Rebuild index error: %s", e)
             raise e
 async def main():
     # Initialize MilvusManager
@@ -501,4 +815,5 @@ async def main():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(main())
\ No newline at end of file
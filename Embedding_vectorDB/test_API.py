@@ -1,38 +1,93 @@
-import requests
-import json
+import argparse
+import asyncio
+import httpx
+import io
+import logging
+import logging.handlers
+import orjson
 import os
+import queue
+import re
 from pathlib import Path
 import time
-from typing import Dict, Any, Optional
-
-
-class DocumentProcessingAPITester:
-    def __init__(self, base_url: str = "http://localhost:8000/"):
-        self.base_url = base_url
-        self.session = requests.Session()
-
-    def test_health_check(self) -> Dict[str, Any]:
-        """Test health check endpoint"""
-        print("🔍 Testing health check endpoint...")
-        try:
-            response = self.session.get(f"{self.base_url}/api/v1/health")
-            result = {
-                "status_code": response.status_code,
-                "response": response.json() if response.status_code == 200 else response.text,
-                "success": response.status_code == 200
-            }
-            print(f"✅ Health check: {'PASSED' if result['success'] else 'FAILED'}")
-            return result
-        except Exception as e:
-            print(f"❌ Health check failed: {e}")
-            return {"success": False, "error": str(e)}
-
-    def test_process_document_text(self, text_content: str = None) -> Dict[str, Any]:
-        """Test API 1 with text content"""
-        print("\n📄 Testing API 1: Process Text Document...")
-
-        if text_content is None:
-            text_content = """
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger("api_tester")
+
+
+class RepeatedErrorFilter(logging.Filter):
+    """
+    Gộp các lỗi giống nhau liên tiếp (cùng template + cùng chi tiết lỗi) khi server down,
+    chỉ log lần đầu và số lần bị bỏ qua - giống cơ chế "once" của warnings
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._last_key = None
+        self._suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.ERROR:
+            return True
+
+        key = (record.msg, str(record.args[-1]) if record.args else None)
+        if key == self._last_key:
+            self._suppressed += 1
+            return False
+
+        self.flush()
+        self._last_key = key
+        return True
+
+    def flush(self):
+        if self._suppressed:
+            suppressed = self._suppressed
+            self._last_key = None
+            self._suppressed = 0
+            logger.error("❌ ... %d similar errors suppressed", suppressed)
+
+
+repeated_error_filter = RepeatedErrorFilter()
+logger.addFilter(repeated_error_filter)
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Log lỗi qua queue, handler ghi ra stderr trên thread riêng để không chặn event loop"""
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener.start()
+    return listener
+
+# Retry giống urllib3 Retry(total=3, backoff_factor=0.2): chỉ áp dụng cho method idempotent
+RETRY_TOTAL = 3
+RETRY_BACKOFF_FACTOR = 0.2
+RETRY_STATUS_FORCELIST = {502, 503, 504}
+RETRY_METHODS = {"GET", "HEAD", "DELETE"}
+
+CONTENT_TYPE_MAP = {
+    '.txt': 'text/plain',
+    '.pdf': 'application/pdf',
+    '.doc': 'application/msword',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.xls': 'application/vnd.ms-excel',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+# Server chưa có bulk endpoint -> quay về gọi từng item
+BULK_UNSUPPORTED_STATUSES = {404, 405}
+
+# Số kết nối mở sẵn trước comprehensive run (~ mức song song của các test)
+WARMUP_CONNECTIONS = 8
+
+STREAM_CHUNK_SIZE = 65536
+MAX_ERROR_TEXT = 2048
+# Test xoá chỉ kiểm tra status code, lỗi lưu ngắn gọn
+MAX_DELETE_ERROR_TEXT = 512
+
+_DEFAULT_DOC_TEXT = """
 # Hướng dẫn sử dụng Trợ lý ảo
 
 ## 1. Giới thiệu
@@ -57,120 +112,257 @@ Các thành viên trong sở nội vụ, người dân, và các cơ quan liên
 - Kiểm tra lại thông tin trước khi sử dụng
 - Liên hệ hỗ trợ khi cần thiết
 """
+_DEFAULT_DOC_TEXT_BYTES = _DEFAULT_DOC_TEXT.encode("utf-8")
+
+_DEFAULT_MARKDOWN = """
+# Thông tin chung về Trợ lý ảo
+
+## 1. Định nghĩa
+Trợ lý ảo (Virtual Assistant) là một ứng dụng phần mềm được thiết kế để hỗ trợ người dùng thực hiện các tác vụ hoặc dịch vụ thông qua giao diện tự nhiên.
+
+## 2. Nguyên lý hoạt động
+
+### 2.1 Cấu tạo
+Hệ thống bao gồm các thành phần chính:
+- Module xử lý ngôn ngữ tự nhiên
+- Cơ sở dữ liệu kiến thức
+- Engine trả lời câu hỏi
+
+### 2.2 Hoạt động
+Quá trình hoạt động gồm các bước:
+1. Tiếp nhận câu hỏi từ người dùng
+2. Phân tích và hiểu ý định câu hỏi
+3. Tìm kiếm thông tin liên quan
+4. Tổng hợp và trả lời
+
+## 3. Kết luận
+Trợ lý ảo là công cụ hữu ích giúp cải thiện hiệu quả công việc và nâng cao trải nghiệm người dùng.
+"""
+
+# Giới hạn số câu hỏi gửi tới chatbot mỗi giây (thay cho sleep cố định giữa các request)
+CHATBOT_MAX_QPS = float(os.getenv("CHATBOT_MAX_QPS", "5"))
+
+
+_LETTER_RE = re.compile(r"[a-zA-Z\u00C0-\u1EF9]")
+
+
+def _is_trivially_invalid(question: str) -> bool:
+    """Câu hỏi rỗng / quá ngắn / không có chữ cái: server chắc chắn từ chối, không cần gọi LLM"""
+    q = question.strip()
+    return len(q) < 2 or not _LETTER_RE.search(q)
+
+
+class AsyncTokenBucket:
+    """Token bucket đơn giản theo monotonic clock: cho phép burst tới `rate` request rồi giãn đều"""
+
+    def __init__(self, rate: float, period: float = 1.0):
+        self.capacity = rate
+        self.fill_rate = rate / period
+        self.tokens = rate
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.fill_rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.fill_rate)
+
+    async def __aenter__(self):
+        await self.acquire()
 
+    async def __aexit__(self, *exc):
+        return False
+
+
+class DocumentProcessingAPITester:
+    def __init__(self, base_url: str = "http://localhost:8000/"):
+        self.base_url = base_url
+        self.session: Optional[httpx.AsyncClient] = None
+        self._chatbot_rate = AsyncTokenBucket(CHATBOT_MAX_QPS)
+
+    async def _get_session(self) -> httpx.AsyncClient:
+        """Tạo AsyncClient (HTTP/2) một lần, dùng chung cho mọi request"""
+        if self.session is None or self.session.is_closed:
+            self.session = httpx.AsyncClient(
+                http2=True,
+                timeout=30.0,
+                limits=httpx.Limits(max_keepalive_connections=50, max_connections=100)
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.is_closed:
+            await self.session.aclose()
+
+    @staticmethod
+    async def _read_response(response: httpx.Response, stream: bool = False, parse_body: bool = True):
+        if response.status_code != 200:
+            # Chỉ đọc phần đầu body lỗi để log không phình to
+            raw = bytearray()
+            async for chunk in response.aiter_bytes():
+                raw += chunk
+                if len(raw) >= MAX_ERROR_TEXT:
+                    break
+            return raw[:MAX_ERROR_TEXT].decode("utf-8", errors="replace")
+
+        if not parse_body:
+            return None
+
+        if not stream:
+            return orjson.loads(await response.aread())
+
+        # Đọc theo chunk rồi parse thẳng từ bytes, tránh giữ thêm bản str của body lớn
+        buf = bytearray()
+        async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+            buf += chunk
+        return orjson.loads(buf)
+
+    async def _request(self, method: str, url: str, stream: bool = False, parse_body: bool = True,
+                       **kwargs) -> Tuple[int, Any]:
+        """Gửi request qua session dùng chung, retry có backoff với lỗi kết nối/5xx tạm thời"""
+        session = await self._get_session()
+        retries = RETRY_TOTAL if method in RETRY_METHODS else 0
+
+        if "json" in kwargs:
+            kwargs["content"] = orjson.dumps(kwargs.pop("json"))
+            kwargs["headers"] = {'Content-Type': 'application/json'}
+
+        for attempt in range(retries + 1):
+            try:
+                async with session.stream(method, url, **kwargs) as response:
+                    if response.status_code not in RETRY_STATUS_FORCELIST or attempt == retries:
+                        return response.status_code, await self._read_response(response, stream, parse_body)
+            except httpx.TransportError:
+                if attempt == retries:
+                    raise
+            await asyncio.sleep(RETRY_BACKOFF_FACTOR * (2 ** attempt))
+
+    async def warm_up(self, connections: int = WARMUP_CONNECTIONS):
+        """Mở sẵn các kết nối keep-alive để thời gian đo của test đầu không gồm handshake"""
+        session = await self._get_session()
+        url = f"{self.base_url}/api/v1/health"
+        await asyncio.gather(
+            *(session.get(url) for _ in range(connections)),
+            return_exceptions=True
+        )
+
+    async def _try_bulk(self, path: str, payload: Dict[str, Any],
+                        parse_body: bool = True) -> Optional[Tuple[int, Any]]:
+        """Gọi bulk endpoint một lần; trả None nếu không dùng được để caller gọi từng item"""
         try:
-            # Create temporary text file
-            temp_file_path = "test_document.txt"
-            with open(temp_file_path, 'w', encoding='utf-8') as f:
-                f.write(text_content)
-
-            # Send request
-            with open(temp_file_path, 'rb') as f:
-                files = {'file': ('test_document.txt', f, 'text/plain')}
-                response = self.session.post(
-                    f"{self.base_url}/api/v1/process-document",
-                    files=files
-                )
+            status, body = await self._request(
+                "POST", f"{self.base_url}{path}", parse_body=parse_body, json=payload
+            )
+        except Exception as e:
+            print(f"⚠️ {path} failed ({e}), falling back to per-item calls")
+            return None
+
+        if status in BULK_UNSUPPORTED_STATUSES:
+            print(f"⚠️ {path} not available, falling back to per-item calls")
+            return None
+        return status, body
+
+    async def test_health_check(self) -> Dict[str, Any]:
+        """Test health check endpoint"""
+        print("🔍 Testing health check endpoint...")
+        try:
+            status, body = await self._request("GET", f"{self.base_url}/api/v1/health")
+            result = {
+                "status_code": status,
+                "response": body,
+                "success": status == 200
+            }
+            print(f"✅ Health check: {'PASSED' if result['success'] else 'FAILED'}")
+            return result
+        except Exception as e:
+            logger.error("❌ Health check failed: %s", e)
+            return {"success": False, "error": str(e)}
+
+    async def test_process_document_text(self, text_content: str = None) -> Dict[str, Any]:
+        """Test API 1 with text content"""
+        print("\n📄 Testing API 1: Process Text Document...")
 
-            # Clean up
-            os.remove(temp_file_path)
+        try:
+            # Upload thẳng từ bộ nhớ, không cần file tạm trên đĩa
+            buf = io.BytesIO(text_content.encode('utf-8') if text_content is not None else _DEFAULT_DOC_TEXT_BYTES)
+            files = {'file': ('test_document.txt', buf, 'text/plain')}
+            status, body = await self._request(
+                "POST",
+                f"{self.base_url}/api/v1/process-document",
+                stream=True,
+                files=files
+            )
 
             result = {
-                "status_code": response.status_code,
-                "success": response.status_code == 200,
-                "response": response.json() if response.status_code == 200 else response.text
+                "status_code": status,
+                "success": status == 200,
+                "response": body
             }
 
             if result["success"]:
                 print("✅ Process document: PASSED")
                 print(f"📝 Markdown length: {len(result['response']['markdown_content'])}")
             else:
-                print("❌ Process document: FAILED")
-                print(f"Error: {result['response']}")
+                logger.error("❌ Process document: FAILED - %s", result['response'])
 
             return result
 
         except Exception as e:
-            print(f"❌ Process document failed: {e}")
+            logger.error("❌ Process document failed: %s", e)
             return {"success": False, "error": str(e)}
 
-    def test_process_document_file(self, file_path: str) -> Dict[str, Any]:
+    async def test_process_document_file(self, file_path: str) -> Dict[str, Any]:
         """Test API 1 with actual file"""
         print(f"\n📁 Testing API 1: Process File {file_path}...")
 
-        if not os.path.exists(file_path):
-            print(f"❌ File not found: {file_path}")
-            return {"success": False, "error": "File not found"}
+        p = Path(file_path)
 
         try:
             # Determine content type
-            file_ext = Path(file_path).suffix.lower()
-            content_type_map = {
-                '.txt': 'text/plain',
-                '.pdf': 'application/pdf',
-                '.doc': 'application/msword',
-                '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                '.xls': 'application/vnd.ms-excel',
-                '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            }
-
-            content_type = content_type_map.get(file_ext, 'application/octet-stream')
+            content_type = CONTENT_TYPE_MAP.get(p.suffix.lower(), 'application/octet-stream')
 
-            with open(file_path, 'rb') as f:
-                files = {'file': (Path(file_path).name, f, content_type)}
-                response = self.session.post(
+            with p.open('rb') as f:
+                files = {'file': (p.name, f, content_type)}
+                status, body = await self._request(
+                    "POST",
                     f"{self.base_url}/api/v1/process-document",
+                    stream=True,
                     files=files
                 )
 
             result = {
-                "status_code": response.status_code,
-                "success": response.status_code == 200,
-                "response": response.json() if response.status_code == 200 else response.text
+                "status_code": status,
+                "success": status == 200,
+                "response": body
             }
 
             if result["success"]:
                 print("✅ Process file: PASSED")
                 print(f"📝 Markdown length: {len(result['response']['markdown_content'])}")
             else:
-                print("❌ Process file: FAILED")
-                print(f"Error: {result['response']}")
+                logger.error("❌ Process file: FAILED - %s", result['response'])
 
             return result
 
+        except FileNotFoundError:
+            logger.error("❌ File not found: %s", file_path)
+            return {"success": False, "error": "File not found"}
         except Exception as e:
-            print(f"❌ Process file failed: {e}")
+            logger.error("❌ Process file failed: %s", e)
             return {"success": False, "error": str(e)}
 
-    def test_embed_markdown(self, markdown_content: str = None, document_id: str = "test_doc_001") -> Dict[str, Any]:
+    async def test_embed_markdown(self, markdown_content: str = None, document_id: str = "test_doc_001") -> Dict[str, Any]:
         """Test API 2 with markdown content"""
         print(f"\n🔗 Testing API 2: Embed Markdown for document {document_id}...")
 
         if markdown_content is None:
-            markdown_content = """
-# Thông tin chung về Trợ lý ảo
-
-## 1. Định nghĩa
-Trợ lý ảo (Virtual Assistant) là một ứng dụng phần mềm được thiết kế để hỗ trợ người dùng thực hiện các tác vụ hoặc dịch vụ thông qua giao diện tự nhiên.
-
-## 2. Nguyên lý hoạt động
-
-### 2.1 Cấu tạo
-Hệ thống bao gồm các thành phần chính:
-- Module xử lý ngôn ngữ tự nhiên
-- Cơ sở dữ liệu kiến thức
-- Engine trả lời câu hỏi
-
-### 2.2 Hoạt động
-Quá trình hoạt động gồm các bước:
-1. Tiếp nhận câu hỏi từ người dùng
-2. Phân tích và hiểu ý định câu hỏi
-3. Tìm kiếm thông tin liên quan
-4. Tổng hợp và trả lời
-
-## 3. Kết luận
-Trợ lý ảo là công cụ hữu ích giúp cải thiện hiệu quả công việc và nâng cao trải nghiệm người dùng.
-"""
+            markdown_content = _DEFAULT_MARKDOWN
 
         try:
             payload = {
@@ -178,16 +370,16 @@ Trợ lý ảo là công cụ hữu ích giúp cải thiện hiệu quả công
                 "document_id": document_id
             }
 
-            response = self.session.post(
+            status, body = await self._request(
+                "POST",
                 f"{self.base_url}/api/v1/embed-markdown",
-                json=payload,
-                headers={'Content-Type': 'application/json'}
+                json=payload
             )
 
             result = {
-                "status_code": response.status_code,
-                "success": response.status_code == 200,
-                "response": response.json() if response.status_code == 200 else response.text
+                "status_code": status,
+                "success": status == 200,
+                "response": body
             }
 
             if result["success"]:
@@ -195,16 +387,62 @@ Trợ lý ảo là công cụ hữu ích giúp cải thiện hiệu quả công
                 print(f"🔗 Embeddings created: {result['response']['embeddings_count']}")
                 print(f"💾 Stored in Milvus: {result['response']['stored_count']}")
             else:
-                print("❌ Embed markdown: FAILED")
-                print(f"Error: {result['response']}")
+                logger.error("❌ Embed markdown: FAILED - %s", result['response'])
 
             return result
 
         except Exception as e:
-            print(f"❌ Embed markdown failed: {e}")
+            logger.error("❌ Embed markdown failed: %s", e)
             return {"success": False, "error": str(e)}
 
-    def test_chatbot_ask(self, questions: list = None) -> Dict[str, Any]:
+    async def _ask_one(self, i: int, total: int, question: str) -> Dict[str, Any]:
+        print(f"\n🔹 Test {i}/{total}: {question}...")
+
+        try:
+            payload = {
+                "question": question
+            }
+
+            async with self._chatbot_rate:
+                start_time = time.time()
+                status, body = await self._request(
+                    "POST",
+                    f"{self.base_url}/api/v1/chatbot/ask",
+                    json=payload
+                )
+                end_time = time.time()
+
+            result = {
+                "test_number": i,
+                "question": question,
+                "status_code": status,
+                "success": status == 200,
+                "response_time_seconds": round(end_time - start_time, 2),
+                "response": body
+            }
+
+            if result["success"]:
+                response_data = result["response"]["data"]
+                print(f"✅ Question {i}: PASSED")
+                print(f"⏱️  Response time: {result['response_time_seconds']}s")
+                print(f"📝 Answer preview: {response_data['answer'][:100]}...")
+                print(f"📚 References: {', '.join(response_data['references'][:3])}")
+                print(f"🎯 Confidence: {response_data['confidence_score']:.2f}")
+            else:
+                logger.error("❌ Question %d: FAILED - %s", i, result['response'])
+
+            return result
+
+        except Exception as e:
+            logger.error("❌ Question %d failed: %s", i, e)
+            return {
+                "test_number": i,
+                "question": question,
+                "success": False,
+                "error": str(e)
+            }
+
+    async def test_chatbot_ask(self, questions: list = None) -> Dict[str, Any]:
         """Test API 3: Chatbot Ask endpoint"""
         print("\n🤖 Testing API 3: Chatbot Ask...")
 
@@ -217,59 +455,12 @@ Trợ lý ảo là công cụ hữu ích giúp cải thiện hiệu quả công
                 "Chiến lược marketing hiệu quả cho doanh nghiệp"
             ]
 
-        all_results = []
-        successful_tests = 0
-
-        for i, question in enumerate(questions, 1):
-            print(f"\n🔹 Test {i}/{len(questions)}: {question}...")
+        all_results = await asyncio.gather(
+            *(self._ask_one(i, len(questions), q) for i, q in enumerate(questions, 1))
+        )
+        successful_tests = sum(1 for r in all_results if r["success"])
 
-            try:
-                payload = {
-                    "question": question
-                }
-
-                start_time = time.time()
-                response = self.session.post(
-                    f"{self.base_url}/api/v1/chatbot/ask",
-                    json=payload,
-                    headers={'Content-Type': 'application/json'}
-                )
-                end_time = time.time()
-
-                result = {
-                    "test_number": i,
-                    "question": question,
-                    "status_code": response.status_code,
-                    "success": response.status_code == 200,
-                    "response_time_seconds": round(end_time - start_time, 2),
-                    "response": response.json() if response.status_code == 200 else response.text
-                }
-
-                if result["success"]:
-                    successful_tests += 1
-                    response_data = result["response"]["data"]
-                    print(f"✅ Question {i}: PASSED")
-                    print(f"⏱️  Response time: {result['response_time_seconds']}s")
-                    print(f"📝 Answer preview: {response_data['answer'][:100]}...")
-                    print(f"📚 References: {', '.join(response_data['references'][:3])}")
-                    print(f"🎯 Confidence: {response_data['confidence_score']:.2f}")
-                else:
-                    print(f"❌ Question {i}: FAILED")
-                    print(f"Error: {result['response']}")
-
-                all_results.append(result)
-
-                # Small delay between requests
-                time.sleep(0.5)
-
-            except Exception as e:
-                print(f"❌ Question {i} failed: {e}")
-                all_results.append({
-                    "test_number": i,
-                    "question": question,
-                    "success": False,
-                    "error": str(e)
-                })
+        repeated_error_filter.flush()
 
         # Summary for chatbot tests
         print(f"\n🤖 Chatbot API Summary: {successful_tests}/{len(questions)} tests passed")
@@ -279,10 +470,54 @@ Trợ lý ảo là công cụ hữu ích giúp cải thiện hiệu quả công
             "total_tests": len(questions),
             "passed_tests": successful_tests,
             "success_rate": round(successful_tests / len(questions) * 100, 1),
-            "results": all_results
+            "results": list(all_results)
         }
 
-    def test_add_faq(self, faq_data: list = None) -> Dict[str, Any]:
+    async def _add_one_faq(self, i: int, total: int, faq: Dict[str, Any]) -> Dict[str, Any]:
+        print(f"\n🔹 Adding FAQ {i}/{total}: {faq['question'][:50]}...")
+
+        try:
+            payload = {
+                "question": faq["question"],
+                "answer": faq["answer"]
+            }
+
+            if "faq_id" in faq and faq["faq_id"]:
+                payload["faq_id"] = faq["faq_id"]
+
+            status, body = await self._request(
+                "POST",
+                f"{self.base_url}/api/v1/faq/add",
+                json=payload
+            )
+
+            result = {
+                "test_number": i,
+                "question": faq["question"],
+                "status_code": status,
+                "success": status == 200,
+                "response": body
+            }
+
+            if result["success"]:
+                response_data = result["response"]
+                print(f"✅ FAQ {i}: ADDED")
+                print(f"🆔 FAQ ID: {response_data['faq_id']}")
+            else:
+                logger.error("❌ FAQ %d: FAILED - %s", i, result['response'])
+
+            return result
+
+        except Exception as e:
+            logger.error("❌ FAQ %d failed: %s", i, e)
+            return {
+                "test_number": i,
+                "question": faq["question"],
+                "success": False,
+                "error": str(e)
+            }
+
+    async def test_add_faq(self, faq_data: list = None) -> Dict[str, Any]:
         """Test API 4: Add FAQ endpoint"""
         print("\n➕ Testing API 4: Add FAQ...")
 
@@ -304,54 +539,30 @@ Trợ lý ảo là công cụ hữu ích giúp cải thiện hiệu quả công
                 }  # No faq_id - will be auto-generated
             ]
 
-        all_results = []
-        successful_tests = 0
-
-        for i, faq in enumerate(faq_data, 1):
-            print(f"\n🔹 Adding FAQ {i}/{len(faq_data)}: {faq['question'][:50]}...")
-
-            try:
-                payload = {
-                    "question": faq["question"],
-                    "answer": faq["answer"]
-                }
-
-                if "faq_id" in faq and faq["faq_id"]:
-                    payload["faq_id"] = faq["faq_id"]
-
-                response = self.session.post(
-                    f"{self.base_url}/api/v1/faq/add",
-                    json=payload,
-                    headers={'Content-Type': 'application/json'}
-                )
-
-                result = {
-                    "test_number": i,
-                    "question": faq["question"],
-                    "status_code": response.status_code,
-                    "success": response.status_code == 200,
-                    "response": response.json() if response.status_code == 200 else response.text
-                }
-
-                if result["success"]:
-                    successful_tests += 1
-                    response_data = result["response"]
-                    print(f"✅ FAQ {i}: ADDED")
-                    print(f"🆔 FAQ ID: {response_data['faq_id']}")
-                else:
-                    print(f"❌ FAQ {i}: FAILED")
-                    print(f"Error: {result['response']}")
-
-                all_results.append(result)
-
-            except Exception as e:
-                print(f"❌ FAQ {i} failed: {e}")
+        bulk = await self._try_bulk("/api/v1/faq/add_bulk", {"items": faq_data})
+        if bulk is not None:
+            status, body = bulk
+            item_results = body["results"] if status == 200 else [body] * len(faq_data)
+            all_results = []
+            for i, (faq, item) in enumerate(zip(faq_data, item_results), 1):
+                success = status == 200 and item.get("status") == "success"
                 all_results.append({
                     "test_number": i,
                     "question": faq["question"],
-                    "success": False,
-                    "error": str(e)
+                    "status_code": status,
+                    "success": success,
+                    "response": item
                 })
+                if success:
+                    print(f"✅ FAQ {i}: ADDED")
+                    print(f"🆔 FAQ ID: {item['faq_id']}")
+                else:
+                    logger.error("❌ FAQ %d: FAILED - %s", i, item)
+        else:
+            all_results = await asyncio.gather(
+                *(self._add_one_faq(i, len(faq_data), faq) for i, faq in enumerate(faq_data, 1))
+            )
+        successful_tests = sum(1 for r in all_results if r["success"])
 
         print(f"\n➕ Add FAQ Summary: {successful_tests}/{len(faq_data)} FAQs added")
 
@@ -360,52 +571,72 @@ Trợ lý ảo là công cụ hữu ích giúp cải thiện hiệu quả công
             "total_tests": len(faq_data),
             "passed_tests": successful_tests,
             "success_rate": round(successful_tests / len(faq_data) * 100, 1),
-            "results": all_results
+            "results": list(all_results)
         }
 
-    def test_delete_faq(self, faq_ids: list = None) -> Dict[str, Any]:
-        """Test API 5: Delete FAQ endpoint"""
-        print("\n🗑️ Testing API 5: Delete FAQ...")
+    async def _delete_one_faq(self, i: int, total: int, faq_id: str) -> Dict[str, Any]:
+        print(f"\n🔹 Deleting FAQ {i}/{total}: {faq_id}...")
 
-        if faq_ids is None:
-            faq_ids = ["faq_001", "faq_002", "nonexistent_faq"]
+        try:
+            status, body = await self._request(
+                "DELETE",
+                f"{self.base_url}/api/v1/faq/delete/{faq_id}",
+                parse_body=False
+            )
 
-        all_results = []
-        successful_tests = 0
+            result = {
+                "test_number": i,
+                "faq_id": faq_id,
+                "status_code": status,
+                "success": status == 200
+            }
+            if not result["success"]:
+                result["response"] = body[:MAX_DELETE_ERROR_TEXT]
 
-        for i, faq_id in enumerate(faq_ids, 1):
-            print(f"\n🔹 Deleting FAQ {i}/{len(faq_ids)}: {faq_id}...")
+            if result["success"]:
+                print(f"✅ FAQ {i}: DELETED")
+            else:
+                logger.error("❌ FAQ %d: FAILED - %s", i, result['response'])
 
-            try:
-                response = self.session.delete(
-                    f"{self.base_url}/api/v1/faq/delete/{faq_id}"
-                )
+            return result
 
-                result = {
-                    "test_number": i,
-                    "faq_id": faq_id,
-                    "status_code": response.status_code,
-                    "success": response.status_code == 200,
-                    "response": response.json() if response.status_code == 200 else response.text
-                }
+        except Exception as e:
+            logger.error("❌ Delete FAQ %d failed: %s", i, e)
+            return {
+                "test_number": i,
+                "faq_id": faq_id,
+                "success": False,
+                "error": str(e)
+            }
 
-                if result["success"]:
-                    successful_tests += 1
-                    print(f"✅ FAQ {i}: DELETED")
-                else:
-                    print(f"❌ FAQ {i}: FAILED")
-                    print(f"Error: {result['response']}")
+    async def test_delete_faq(self, faq_ids: list = None) -> Dict[str, Any]:
+        """Test API 5: Delete FAQ endpoint"""
+        print("\n🗑️ Testing API 5: Delete FAQ...")
 
-                all_results.append(result)
+        if faq_ids is None:
+            faq_ids = ["faq_001", "faq_002", "nonexistent_faq"]
 
-            except Exception as e:
-                print(f"❌ Delete FAQ {i} failed: {e}")
-                all_results.append({
-                    "test_number": i,
-                    "faq_id": faq_id,
-                    "success": False,
-                    "error": str(e)
-                })
+        bulk = await self._try_bulk("/api/v1/faq/delete_bulk", {"faq_ids": faq_ids}, parse_body=False)
+        if bulk is not None:
+            status, body = bulk
+            all_results = [{
+                "test_number": i,
+                "faq_id": faq_id,
+                "status_code": status,
+                "success": status == 200
+            } for i, faq_id in enumerate(faq_ids, 1)]
+            if status != 200:
+                for result in all_results:
+                    result["response"] = body[:MAX_DELETE_ERROR_TEXT]
+            if status == 200:
+                print("✅ Bulk delete FAQ: DELETED")
+            else:
+                logger.error("❌ Bulk delete FAQ: FAILED - %s", body[:MAX_DELETE_ERROR_TEXT])
+        else:
+            all_results = await asyncio.gather(
+                *(self._delete_one_faq(i, len(faq_ids), faq_id) for i, faq_id in enumerate(faq_ids, 1))
+            )
+        successful_tests = sum(1 for r in all_results if r["success"])
 
         print(f"\n🗑️ Delete FAQ Summary: {successful_tests}/{len(faq_ids)} FAQs deleted")
 
@@ -413,52 +644,75 @@ Trợ lý ảo là công cụ hữu ích giúp cải thiện hiệu quả công
             "success": successful_tests >= 0,  # Even failed deletes are expected for non-existent FAQs
             "total_tests": len(faq_ids),
             "passed_tests": successful_tests,
-            "results": all_results
+            "results": list(all_results)
         }
 
-    def test_delete_document(self, document_ids: list = None) -> Dict[str, Any]:
-        """Test API 6: Delete Document endpoint"""
-        print("\n🗑️ Testing API 6: Delete Document...")
+    async def _delete_one_document(self, i: int, total: int, doc_id: str) -> Dict[str, Any]:
+        print(f"\n🔹 Deleting Document {i}/{total}: {doc_id}...")
 
-        if document_ids is None:
-            document_ids = ["test_doc_001", "workflow_test_doc", "nonexistent_doc"]
+        try:
+            status, body = await self._request(
+                "DELETE",
+                f"{self.base_url}/api/v1/document/delete/{doc_id}",
+                parse_body=False
+            )
 
-        all_results = []
-        successful_tests = 0
+            result = {
+                "test_number": i,
+                "document_id": doc_id,
+                "status_code": status,
+                "success": status == 200
+            }
+            if not result["success"]:
+                result["response"] = body[:MAX_DELETE_ERROR_TEXT]
 
-        for i, doc_id in enumerate(document_ids, 1):
-            print(f"\n🔹 Deleting Document {i}/{len(document_ids)}: {doc_id}...")
+            if result["success"]:
+                print(f"✅ Document {i}: DELETED")
+            else:
+                logger.error("❌ Document %d: FAILED - %s", i, result['response'])
 
-            try:
-                response = self.session.delete(
-                    f"{self.base_url}/api/v1/document/delete/{doc_id}"
-                )
+            return result
 
-                result = {
-                    "test_number": i,
-                    "document_id": doc_id,
-                    "status_code": response.status_code,
-                    "success": response.status_code == 200,
-                    "response": response.json() if response.status_code == 200 else response.text
-                }
+        except Exception as e:
+            logger.error("❌ Delete Document %d failed: %s", i, e)
+            return {
+                "test_number": i,
+                "document_id": doc_id,
+                "success": False,
+                "error": str(e)
+            }
 
-                if result["success"]:
-                    successful_tests += 1
-                    print(f"✅ Document {i}: DELETED")
-                else:
-                    print(f"❌ Document {i}: FAILED")
-                    print(f"Error: {result['response']}")
+    async def test_delete_document(self, document_ids: list = None) -> Dict[str, Any]:
+        """Test API 6: Delete Document endpoint"""
+        print("\n🗑️ Testing API 6: Delete Document...")
 
-                all_results.append(result)
+        if document_ids is None:
+            document_ids = ["test_doc_001", "workflow_test_doc", "nonexistent_doc"]
 
-            except Exception as e:
-                print(f"❌ Delete Document {i} failed: {e}")
-                all_results.append({
-                    "test_number": i,
-                    "document_id": doc_id,
-                    "success": False,
-                    "error": str(e)
-                })
+        bulk = await self._try_bulk(
+            "/api/v1/document/delete_bulk", {"document_ids": document_ids}, parse_body=False
+        )
+        if bulk is not None:
+            status, body = bulk
+            all_results = [{
+                "test_number": i,
+                "document_id": doc_id,
+                "status_code": status,
+                "success": status == 200
+            } for i, doc_id in enumerate(document_ids, 1)]
+            if status != 200:
+                for result in all_results:
+                    result["response"] = body[:MAX_DELETE_ERROR_TEXT]
+            if status == 200:
+                print("✅ Bulk delete documents: DELETED")
+            else:
+                logger.error("❌ Bulk delete documents: FAILED - %s", body[:MAX_DELETE_ERROR_TEXT])
+        else:
+            all_results = await asyncio.gather(
+                *(self._delete_one_document(i, len(document_ids), doc_id)
+                  for i, doc_id in enumerate(document_ids, 1))
+            )
+        successful_tests = sum(1 for r in all_results if r["success"])
 
         print(f"\n🗑️ Delete Document Summary: {successful_tests}/{len(document_ids)} documents deleted")
 
@@ -466,11 +720,15 @@ Trợ lý ảo là công cụ hữu ích giúp cải thiện hiệu quả công
             "success": successful_tests >= 0,  # Even failed deletes are expected
             "total_tests": len(document_ids),
             "passed_tests": successful_tests,
-            "results": all_results
+            "results": list(all_results)
         }
 
-    def test_chatbot_edge_cases(self) -> Dict[str, Any]:
-        """Test chatbot with edge cases"""
+    async def test_chatbot_edge_cases(self, force_remote: bool = False) -> Dict[str, Any]:
+        """
+        Test chatbot with edge cases
+        Input rõ ràng không hợp lệ được kiểm tra phía client, trừ khi force_remote=True
+        (--force-remote-edge-cases) để test validation của server
+        """
         print("\n🧪 Testing Chatbot Edge Cases...")
 
         edge_cases = [
@@ -485,31 +743,42 @@ Trợ lý ảo là công cụ hữu ích giúp cải thiện hiệu quả công
         for case in edge_cases:
             print(f"\n🔸 Testing: {case['description']}")
 
+            if not force_remote and _is_trivially_invalid(case["question"]):
+                print(f"✅ {case['description']}: Rejected client-side")
+                results.append({
+                    "description": case["description"],
+                    "question": case["question"],
+                    "success": True,
+                    "validated_client_side": True
+                })
+                continue
+
             try:
                 payload = {"question": case["question"]}
-                response = self.session.post(
-                    f"{self.base_url}/api/v1/chatbot/ask",
-                    json=payload,
-                    headers={'Content-Type': 'application/json'}
-                )
+                async with self._chatbot_rate:
+                    status, body = await self._request(
+                        "POST",
+                        f"{self.base_url}/api/v1/chatbot/ask",
+                        json=payload
+                    )
 
                 result = {
                     "description": case["description"],
                     "question": case["question"],
-                    "status_code": response.status_code,
-                    "success": response.status_code == 200,
-                    "response": response.json() if response.status_code == 200 else response.text
+                    "status_code": status,
+                    "success": status == 200,
+                    "response": body
                 }
 
                 if result["success"]:
                     print(f"✅ {case['description']}: Handled gracefully")
                 else:
-                    print(f"❌ {case['description']}: {result['response']}")
+                    logger.error("❌ %s: %s", case['description'], result['response'])
 
                 results.append(result)
 
             except Exception as e:
-                print(f"❌ {case['description']} failed: {e}")
+                logger.error("❌ %s failed: %s", case['description'], e)
                 results.append({
                     "description": case["description"],
                     "success": False,
@@ -521,31 +790,31 @@ Trợ lý ảo là công cụ hữu ích giúp cải thiện hiệu quả công
             "results": results
         }
 
-    def test_full_workflow(self, test_text: str = None) -> Dict[str, Any]:
+    async def test_full_workflow(self, test_text: str = None) -> Dict[str, Any]:
         """Test complete workflow: Document -> Markdown -> Embeddings -> FAQ -> Cleanup"""
         print("\n🔄 Testing Full Workflow...")
 
         # Step 1: Process document
-        doc_result = self.test_process_document_text(test_text)
+        doc_result = await self.test_process_document_text(test_text)
         if not doc_result.get("success"):
             return {"success": False, "error": "Document processing failed", "step": 1}
 
         # Step 2: Embed markdown
         markdown_content = doc_result["response"]["markdown_content"]
-        embed_result = self.test_embed_markdown(markdown_content, "workflow_test_doc")
+        embed_result = await self.test_embed_markdown(markdown_content, "workflow_test_doc")
 
         if not embed_result.get("success"):
             return {"success": False, "error": "Embedding failed", "step": 2}
 
-        # Step 3: Add FAQ
-        faq_result = self.test_add_faq([{
-            "question": "Quy trình làm việc của hệ thống như thế nào?",
-            "answer": "Hệ thống hoạt động theo quy trình: nhận tài liệu -> xử lý -> tạo embedding -> lưu trữ -> trả lời câu hỏi.",
-            "faq_id": "workflow_faq"
-        }])
-
-        # Step 4: Test chatbot
-        chat_result = self.test_chatbot_ask(["Hệ thống hoạt động như thế nào?"])
+        # Step 3 + 4: Add FAQ và test chatbot không phụ thuộc nhau -> chạy song song
+        faq_result, chat_result = await asyncio.gather(
+            self.test_add_faq([{
+                "question": "Quy trình làm việc của hệ thống như thế nào?",
+                "answer": "Hệ thống hoạt động theo quy trình: nhận tài liệu -> xử lý -> tạo embedding -> lưu trữ -> trả lời câu hỏi.",
+                "faq_id": "workflow_faq"
+            }]),
+            self.test_chatbot_ask(["Hệ thống hoạt động như thế nào?"])
+        )
 
         print("✅ Full workflow: COMPLETED")
         return {
@@ -580,66 +849,81 @@ Thời gian xử lý: 15 ngày làm việc kể từ ngày tiếp nhận hồ s
 Thông báo kết quả qua SMS, email hoặc công dân đến trực tiếp để nhận.
 """)
 
-        # Sample CSV file (as table example)
+        # Sample Excel file (as table example) - openpyxl write_only, không cần pandas
         try:
-            import pandas as pd
-            df = pd.DataFrame([
-                {"STT": 1, "Câu hỏi": "Ai sẽ là người sử dụng Trợ lý ảo (TLA)",
-                 "Trả lời mong muốn": "VD: Các thành viên trong sở nội vụ, người dân, ...",
-                 "Chú thích": "Nếu sử dụng nội dung bên ngoài. Câu trả lời có thể khác với những gì TLA được học"},
-                {"STT": 2, "Câu hỏi": "Phạm vi trợ lý ảo có thể trả lời",
-                 "Trả lời mong muốn": "VD: Các thông tư văn bản được training hay có thể tìm kiếm thông tin bên ngoài để trả lời",
-                 "Chú thích": "Cần training dữ liệu phù hợp"},
-            ])
-            df.to_excel("sample_table.xlsx", index=False)
+            from openpyxl import Workbook
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet()
+            ws.append(["STT", "Câu hỏi", "Trả lời mong muốn", "Chú thích"])
+            ws.append([1, "Ai sẽ là người sử dụng Trợ lý ảo (TLA)",
+                       "VD: Các thành viên trong sở nội vụ, người dân, ...",
+                       "Nếu sử dụng nội dung bên ngoài. Câu trả lời có thể khác với những gì TLA được học"])
+            ws.append([2, "Phạm vi trợ lý ảo có thể trả lời",
+                       "VD: Các thông tư văn bản được training hay có thể tìm kiếm thông tin bên ngoài để trả lời",
+                       "Cần training dữ liệu phù hợp"])
+            wb.save("sample_table.xlsx")
             print("✅ Sample files created: sample_text.txt, sample_table.xlsx")
         except ImportError:
-            print("⚠️ pandas not available, skipping Excel file creation")
+            print("⚠️ openpyxl not available, skipping Excel file creation")
             print("✅ Sample file created: sample_text.txt")
 
-    def run_comprehensive_test(self):
+    async def run_comprehensive_test(self, create_samples: bool = False, force_remote_edge_cases: bool = False):
         """Run all tests"""
         print("🚀 Starting Comprehensive API Testing...")
         print("=" * 60)
 
-        results = {}
-
-        # Test 0: Health check
-        results["health"] = self.test_health_check()
-
-        # Test 1: Create sample files
-        self.create_sample_files()
+        await self.warm_up()
 
-        # Test 2: Process text document
-        results["process_text"] = self.test_process_document_text()
+        # Test 1: Create sample files (chỉ tạo lại khi được yêu cầu hoặc còn thiếu)
+        if create_samples or not (os.path.exists("sample_text.txt") and os.path.exists("sample_table.xlsx")):
+            self.create_sample_files()
 
-        # Test 3: Process actual files
+        # Các test độc lập chạy song song; chỉ giữ thứ tự ở chỗ có phụ thuộc dữ liệu
+        tasks = {
+            "health": self.test_health_check(),
+            "process_text": self.test_process_document_text(),
+        }
         if os.path.exists("sample_text.txt"):
-            results["process_file_txt"] = self.test_process_document_file("sample_text.txt")
-
+            tasks["process_file_txt"] = self.test_process_document_file("sample_text.txt")
         if os.path.exists("sample_table.xlsx"):
-            results["process_file_xlsx"] = self.test_process_document_file("sample_table.xlsx")
+            tasks["process_file_xlsx"] = self.test_process_document_file("sample_table.xlsx")
+        tasks["embed_markdown"] = self.test_embed_markdown()
+        tasks["add_faq"] = self.test_add_faq()
+        tasks["chatbot_edge_cases"] = self.test_chatbot_edge_cases(force_remote_edge_cases)
 
-        # Test 4: Embed markdown
-        results["embed_markdown"] = self.test_embed_markdown()
+        tasks = {name: asyncio.create_task(coro) for name, coro in tasks.items()}
 
-        # Test 5: Add FAQ
-        results["add_faq"] = self.test_add_faq()
+        # Chatbot cần tài liệu đã embed và FAQ đã thêm
+        await asyncio.gather(tasks["embed_markdown"], tasks["add_faq"])
+        chatbot_ask = await self.test_chatbot_ask()
 
-        # Test 6: Chatbot Ask - Normal cases
-        results["chatbot_ask"] = self.test_chatbot_ask()
+        # Xoá FAQ / tài liệu sau khi chatbot đã dùng xong dữ liệu
+        delete_faq, delete_document = await asyncio.gather(
+            self.test_delete_faq(),
+            self.test_delete_document()
+        )
 
-        # Test 7: Chatbot Ask - Edge cases
-        results["chatbot_edge_cases"] = self.test_chatbot_edge_cases()
+        independent = dict(zip(tasks, await asyncio.gather(*tasks.values())))
 
-        # Test 8: Delete FAQ
-        results["delete_faq"] = self.test_delete_faq()
+        # Full workflow dùng lại workflow_test_doc nên chạy sau khi xoá tài liệu
+        full_workflow = await self.test_full_workflow()
 
-        # Test 9: Delete Document
-        results["delete_document"] = self.test_delete_document()
-
-        # Test 10: Full workflow
-        results["full_workflow"] = self.test_full_workflow()
+        results = {
+            "health": independent["health"],
+            "process_text": independent["process_text"],
+        }
+        for name in ("process_file_txt", "process_file_xlsx"):
+            if name in independent:
+                results[name] = independent[name]
+        results.update({
+            "embed_markdown": independent["embed_markdown"],
+            "add_faq": independent["add_faq"],
+            "chatbot_ask": chatbot_ask,
+            "chatbot_edge_cases": independent["chatbot_edge_cases"],
+            "delete_faq": delete_faq,
+            "delete_document": delete_document,
+            "full_workflow": full_workflow,
+        })
 
         # Summary
         print("\n" + "=" * 60)
@@ -661,7 +945,7 @@ Thông báo kết quả qua SMS, email hoặc công dân đến trực tiếp đ
         return results
 
 
-def test_individual_apis():
+async def test_individual_apis(force_remote_edge_cases: bool = False):
     """Test individual APIs separately"""
     tester = DocumentProcessingAPITester()
 
@@ -672,21 +956,68 @@ def test_individual_apis():
     print("🤖 CHATBOT API ONLY")
     print("=" * 30)
 
-    chatbot_result = tester.test_chatbot_ask([
+    chatbot_result = await tester.test_chatbot_ask([
         "Trợ lý ảo hoạt động như thế nào?",
         "AI có thể ứng dụng trong lĩnh vực gì?",
         "Quy trình xử lý dữ liệu ra sao?"
     ])
 
-    edge_case_result = tester.test_chatbot_edge_cases()
+    edge_case_result = await tester.test_chatbot_edge_cases(force_remote_edge_cases)
+    await tester.close()
 
     print(f"\n📋 Chatbot Test Results:")
     print(f"✅ Normal questions: {chatbot_result['passed_tests']}/{chatbot_result['total_tests']}")
     print(f"🧪 Edge cases handled: {len(edge_case_result['results'])}")
 
 
+def save_results(results: Dict[str, Any], path: Path):
+    """
+    Ghi test_results.json từng test một: vẫn là một JSON object như cũ,
+    nhưng chỉ serialize một entry tại một thời điểm thay vì cả dict lớn
+    """
+    option = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+    with path.open("wb") as f:
+        f.write(b"{")
+        for i, (test_name, result) in enumerate(results.items()):
+            f.write(b",\n  " if i else b"\n  ")
+            f.write(orjson.dumps(test_name))
+            f.write(b": ")
+            f.write(orjson.dumps(result, option=option).replace(b"\n", b"\n  "))
+        f.write(b"\n}\n")
+
+
+async def _run_and_close(tester: DocumentProcessingAPITester, test_fn, *args, **kwargs):
+    try:
+        return await test_fn(*args, **kwargs)
+    finally:
+        await tester.close()
+
+
 def main():
     """Run API tests"""
+    parser = argparse.ArgumentParser(description="Document processing API tester")
+    parser.add_argument("--create-samples", action="store_true",
+                        help="Tạo lại sample_text.txt / sample_table.xlsx trước khi chạy comprehensive test")
+    parser.add_argument("--force-remote-edge-cases", action="store_true",
+                        help="Gửi cả các edge case không hợp lệ lên server (test validation phía server)")
+    args = parser.parse_args()
+
+    # uvloop (đi kèm uvicorn[standard]) nhanh hơn event loop mặc định; không có thì bỏ qua
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
+    log_listener = setup_logging()
+    try:
+        _run_selected_mode(args)
+    finally:
+        repeated_error_filter.flush()
+        log_listener.stop()
+
+
+def _run_selected_mode(args: argparse.Namespace):
     # Initialize tester
     tester = DocumentProcessingAPITester()
 
@@ -699,16 +1030,19 @@ def main():
     choice = input("Enter choice (1-3) [default: 1]: ").strip() or "1"
 
     if choice == "2":
-        test_individual_apis()
+        asyncio.run(test_individual_apis(args.force_remote_edge_cases))
     elif choice == "3":
-        tester.test_health_check()
+        asyncio.run(_run_and_close(tester, tester.test_health_check))
     else:
         # Run comprehensive tests
-        results = tester.run_comprehensive_test()
+        results = asyncio.run(_run_and_close(
+            tester, tester.run_comprehensive_test,
+            create_samples=args.create_samples,
+            force_remote_edge_cases=args.force_remote_edge_cases
+        ))
 
         # Save results to file
-        with open("test_results.json", "w", encoding="utf-8") as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+        save_results(results, Path("test_results.json"))
 
         print(f"\n💾 Test results saved to test_results.json")
 
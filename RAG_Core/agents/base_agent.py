@@ -3,12 +3,28 @@
 Base class cho tất cả agents với streaming support
 """
 
-from typing import Dict, Any, List, AsyncIterator
-from models.llm_model import llm_model
+from typing import Dict, Any, List, AsyncIterator, Optional
+from models.llm_model import llm_model, LLMErrorText
+from config.settings import settings
+from utils.helpers import compile_prompt, is_short_answer
+from collections import OrderedDict
 import logging
+import re
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+# Gộp các chunk nhỏ từ LLM trước khi yield để giảm số lần await phía consumer
+STREAM_COALESCE_CHARS = 64
+
+# Số message lịch sử gần nhất đưa vào prompt (3 turn) - giữ chi phí join và prefill cố định
+MAX_HISTORY_MESSAGES = 6
+
+# References cố định, dùng chung cho mọi response (chỉ đọc - không sửa tại call-site)
+SUPPORT_REFERENCES = ({"document_id": "support_contact", "type": "SUPPORT"},)
+GENERAL_KNOWLEDGE_REFERENCES = ({"document_id": "llm_knowledge", "type": "GENERAL_KNOWLEDGE"},)
+
 
 class BaseStreamingAgent:
     """
@@ -17,7 +33,20 @@ class BaseStreamingAgent:
 
     def __init__(self, name: str, prompt_template: str):
         self.name = name
+        # support_phone cố định theo settings - điền sẵn một lần để prefix tĩnh dài hơn
+        prompt_template = prompt_template.replace(
+            "{support_phone}", settings.SUPPORT_PHONE.replace("{", "{{").replace("}", "}}")
+        )
         self.prompt_template = prompt_template
+        # Phần hướng dẫn tĩnh trước placeholder đầu tiên - giống hệt giữa các request
+        # nên Ollama dùng lại được KV cache của prompt
+        self._prefix = prompt_template.split("{", 1)[0]
+        # Tách template một lần để format bằng "".join thay vì chạy lại format mỗi request
+        self._render_prompt = compile_prompt(prompt_template)
+
+    async def warm_prefix(self) -> bool:
+        """Prefill sẵn phần prefix tĩnh trên LLM server"""
+        return await llm_model.awarm_prefix(self._prefix)
 
     def process(self, **kwargs) -> Dict[str, Any]:
         """
@@ -26,6 +55,13 @@ class BaseStreamingAgent:
         """
         raise NotImplementedError("Subclass must implement process()")
 
+    async def aprocess(self, **kwargs) -> Dict[str, Any]:
+        """
+        Async non-streaming process (dùng llm_model.ainvoke)
+        Subclass override nếu cần logic đặc biệt
+        """
+        raise NotImplementedError("Subclass must implement aprocess()")
+
     async def process_streaming(self, **kwargs) -> AsyncIterator[str]:
         """
         Streaming process - DEFAULT IMPLEMENTATION
@@ -39,20 +75,48 @@ class BaseStreamingAgent:
             # Subclass phải implement method này để format prompt
             prompt = self._format_prompt(**kwargs)
 
-            logger.info(f"🚀 {self.name}: Starting streaming")
-
-            chunk_count = 0
-            async for chunk in llm_model.astream(prompt):
-                if chunk:
-                    chunk_count += 1
-                    logger.debug(f"{self.name} chunk #{chunk_count}: {chunk[:30]}...")
-                    yield chunk
-
-            logger.info(f"✅ {self.name}: Completed {chunk_count} chunks")
+            async for chunk in self._stream_llm(prompt):
+                yield chunk
 
         except Exception as e:
-            logger.error(f"❌ {self.name} streaming error: {e}", exc_info=True)
-            yield f"\n\n[Lỗi {self.name}: {str(e)}]"
+            yield self._stream_error(e)
+
+    async def _stream_llm(self, prompt: str) -> AsyncIterator[str]:
+        """Stream từ LLM, gộp chunk nhỏ thành ~STREAM_COALESCE_CHARS ký tự; lỗi được raise lên caller"""
+        logger.info("🚀 %s: Starting streaming", self.name)
+
+        debug_on = logger.isEnabledFor(logging.DEBUG)
+        chunk_count = 0
+        buf = []
+        buflen = 0
+        async for chunk in llm_model.astream(prompt):
+            if isinstance(chunk, LLMErrorText):
+                # Không gộp thông báo lỗi vào buffer - caller cần nhận diện được chunk lỗi
+                if buf:
+                    yield "".join(buf)
+                    buf.clear()
+                    buflen = 0
+                yield chunk
+                continue
+            if chunk:
+                chunk_count += 1
+                if debug_on:
+                    logger.debug("%s chunk #%d: %.30s...", self.name, chunk_count, chunk)
+                buf.append(chunk)
+                buflen += len(chunk)
+                if buflen >= STREAM_COALESCE_CHARS:
+                    yield "".join(buf)
+                    buf.clear()
+                    buflen = 0
+
+        if buf:
+            yield "".join(buf)
+
+        logger.info("✅ %s: Completed %d chunks", self.name, chunk_count)
+
+    def _stream_error(self, e: Exception) -> str:
+        logger.error("❌ %s streaming error: %s", self.name, e, exc_info=True)
+        return f"\n\n[Lỗi {self.name}: {str(e)}]"
 
     def _format_prompt(self, **kwargs) -> str:
         """
@@ -68,6 +132,14 @@ class BaseStreamingAgent:
         """
         return "Xin lỗi, tôi không thể xử lý yêu cầu này lúc này."
 
+    def _error_result(self) -> Dict[str, Any]:
+        return {
+            "status": "ERROR",
+            "answer": self._get_fallback_answer(),
+            "references": [],
+            "next_agent": "end"
+        }
+
 
 # ============================================================================
 # STREAMING-ENABLED AGENTS
@@ -76,15 +148,30 @@ class BaseStreamingAgent:
 class StreamingChatterAgent(BaseStreamingAgent):
     """ChatterAgent với streaming thật"""
 
+    # Cụm từ cảm xúc tiêu cực rõ ràng - khớp thì trả lời an ủi soạn sẵn, không gọi LLM
+    _NEGATIVE_PHRASES = (
+        "bực", "bực mình", "bực bội", "bực quá", "tức", "tức quá", "tức giận", "điên",
+        "điên tiết", "phát điên", "cáu", "khó chịu", "chán", "chán quá", "chán nản",
+        "thất vọng", "quá thất vọng", "tệ", "tệ quá", "quá tệ", "tồi", "tồi tệ", "kém",
+        "kém cỏi", "dở", "dở tệ", "dở ẹc", "lừa đảo", "lừa", "lừa gạt", "lừa dối",
+        "gian lận", "vô trách nhiệm", "thái độ", "không hài lòng",
+        "không chấp nhận", "không thể chấp nhận", "quá đáng", "vớ vẩn", "vô lý",
+        "phiền", "phiền phức", "mất thời gian", "chậm quá", "chờ mãi", "đợi mãi",
+        "không ai trả lời", "không ai hỗ trợ", "khiếu nại", "phản ánh", "tẩy chay",
+        "đòi tiền", "bức xúc", "ức chế", "ghét"
+    )
+    _NEGATIVE_RE = re.compile(
+        r"(?<!\w)(?:" + "|".join(
+            re.escape(p) for p in sorted(_NEGATIVE_PHRASES, key=len, reverse=True)
+        ) + r")(?!\w)",
+        re.IGNORECASE
+    )
+
     def __init__(self):
         prompt_template = """Bạn là một chuyên viên tư vấn khách hàng người Việt Nam thân thiện và chuyên nghiệp - chuyên gia xử lý cảm xúc và an ủi khách hàng.
 
 Nhiệm vụ: An ủi, làm dịu cảm xúc tiêu cực của khách hàng và cung cấp thông tin liên hệ hỗ trợ.
 
-Nội dung khách hàng: "{question}"
-Lịch sử hội thoại: {history}
-Số điện thoại hỗ trợ: {support_phone}
-
 Hướng dẫn:
 1. Thể hiện sự thông cảm và hiểu biết cảm xúc khách hàng
 2. Xin lỗi một cách chân thành
@@ -92,49 +179,105 @@ Hướng dẫn:
 4. Cung cấp số hotline để được hỗ trợ trực tiếp
 5. Giữ thái độ ấm áp, chuyên nghiệp
 
+Số điện thoại hỗ trợ: {support_phone}
+Lịch sử hội thoại: {history}
+Nội dung khách hàng: "{question}"
+
 Trả lời:"""
 
         super().__init__("CHATTER", prompt_template)
-        self.support_phone = None  # Will be set from settings
 
-    def _format_prompt(self, question: str, history: List = None, support_phone: str = "", **kwargs) -> str:
-        history_text = "\n".join(history) if history else "Không có lịch sử"
+        self.support_phone = settings.SUPPORT_PHONE
+        self._comfort_answer = f"""Tôi rất hiểu cảm xúc của bạn và chân thành xin lỗi về những bất tiện này.
+
+Ý kiến của bạn rất quan trọng với chúng tôi và chúng tôi sẽ không ngừng cải thiện để mang đến trải nghiệm tốt hơn.
+
+Để được hỗ trợ trực tiếp và giải quyết nhanh chóng, bạn vui lòng liên hệ:
+📞 Hotline: {self.support_phone}
+
+Đội ngũ chuyên viên sẽ hỗ trợ bạn 24/7. Cảm ơn bạn đã chia sẻ!"""
+
+    def _get_fallback_answer(self, **kwargs) -> str:
+        return self._comfort_answer
 
-        return self.prompt_template.format(
+    def _fast_answer(self, question: str, history: List = None) -> Optional[str]:
+        """Câu an ủi soạn sẵn khi câu đầu tiên mang cảm xúc tiêu cực rõ ràng"""
+        if not history and question and self._NEGATIVE_RE.search(question):
+            logger.info("⚡ CHATTER fast path: negative keyword matched, skip LLM")
+            return self._comfort_answer
+        return None
+
+    def _format_prompt(self, question: str, history: List = None, **kwargs) -> str:
+        history_text = self._format_history(history)
+
+        return self._render_prompt(
             question=question,
-            history=history_text,
-            support_phone=support_phone
+            history=history_text
         )
 
+    def _format_history(self, history: List = None) -> str:
+        """Chỉ join MAX_HISTORY_MESSAGES message cuối, hỗ trợ str / dict / ChatMessage"""
+        if not history:
+            return "Không có lịch sử"
+
+        history_lines = []
+        for msg in history[-MAX_HISTORY_MESSAGES:]:
+            if isinstance(msg, str):
+                history_lines.append(msg)
+                continue
+
+            if isinstance(msg, dict):
+                role, content = msg.get("role", ""), msg.get("content", "")
+            else:
+                role, content = getattr(msg, "role", ""), getattr(msg, "content", "")
+
+            if content:
+                history_lines.append(f"{'Người dùng' if role == 'user' else 'Trợ lý'}: {content}")
+
+        return "\n".join(history_lines) if history_lines else "Không có lịch sử"
+
+    def _build_prompt(self, question: str, history: List = None) -> str:
+        return self._format_prompt(question=question, history=history)
+
+    def _build_result(self, answer: str) -> Dict[str, Any]:
+        if is_short_answer(answer):
+            answer = self._get_fallback_answer()
+
+        return {
+            "status": "SUCCESS",
+            "answer": answer,
+            "references": SUPPORT_REFERENCES,
+            "next_agent": "end"
+        }
+
     def process(self, question: str, history: List = None, **kwargs) -> Dict[str, Any]:
         """Non-streaming process"""
         try:
-            from config.settings import settings
-
-            prompt = self._format_prompt(
-                question=question,
-                history=history,
-                support_phone=settings.SUPPORT_PHONE
-            )
+            answer = self._fast_answer(question, history)
+            if answer is None:
+                answer = llm_model.invoke(self._build_prompt(question, history))
+            return self._build_result(answer)
+        except Exception as e:
+            return self._error_result()
 
-            answer = llm_model.invoke(prompt)
+    async def aprocess(self, question: str, history: List = None, **kwargs) -> Dict[str, Any]:
+        """Async non-streaming process"""
+        try:
+            answer = self._fast_answer(question, history)
+            if answer is None:
+                answer = await llm_model.ainvoke(self._build_prompt(question, history))
+            return self._build_result(answer)
+        except Exception as e:
+            return self._error_result()
 
-            if not answer or len(answer.strip()) < 10:
-                answer = self._get_fallback_answer()
+    async def process_streaming(self, **kwargs) -> AsyncIterator[str]:
+        answer = self._fast_answer(kwargs.get("question", ""), kwargs.get("history"))
+        if answer is not None:
+            yield answer
+            return
 
-            return {
-                "status": "SUCCESS",
-                "answer": answer,
-                "references": [{"document_id": "support_contact", "type": "SUPPORT"}],
-                "next_agent": "end"
-            }
-        except Exception as e:
-            return {
-                "status": "ERROR",
-                "answer": self._get_fallback_answer(),
-                "references": [],
-                "next_agent": "end"
-            }
+        async for chunk in super().process_streaming(**kwargs):
+            yield chunk
 
 
 class StreamingOtherAgent(BaseStreamingAgent):
@@ -145,53 +288,117 @@ class StreamingOtherAgent(BaseStreamingAgent):
 
 Nhiệm vụ: Thông báo lịch sự khi yêu cầu nằm ngoài phạm vi và hướng dẫn khách hàng.
 
-Yêu cầu của khách hàng: "{question}"
-Số điện thoại hỗ trợ: {support_phone}
-
 Hướng dẫn:
 1. Giải thích rằng yêu cầu nằm ngoài phạm vi hỗ trợ hiện tại
 2. Đề xuất liên hệ hotline để được tư vấn cụ thể hơn
 3. Giữ thái độ lịch sự và chuyên nghiệp
 4. Không từ chối một cách thô lỗ
 
+Số điện thoại hỗ trợ: {support_phone}
+Yêu cầu của khách hàng: "{question}"
+
 Trả lời:"""
 
         super().__init__("OTHER", prompt_template)
 
-    def _format_prompt(self, question: str, support_phone: str = "", **kwargs) -> str:
-        return self.prompt_template.format(
-            question=question,
-            support_phone=support_phone
-        )
+        # Prompt OTHER chỉ phụ thuộc câu hỏi -> cache câu trả lời theo câu hỏi đã chuẩn hóa (LRU + TTL)
+        self.answer_cache_size = 1024
+        self.answer_cache_ttl = 300
+        self.answer_cache_max_question_chars = 512
+        self._answer_cache = OrderedDict()
+        self._answer_cache_lock = threading.Lock()
+
+    def _answer_cache_key(self, question: str) -> Optional[str]:
+        if not question or len(question) > self.answer_cache_max_question_chars:
+            return None
+        return " ".join(question.casefold().split())
+
+    def _get_cached_answer(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        with self._answer_cache_lock:
+            entry = self._answer_cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._answer_cache[key]
+                return None
+            self._answer_cache.move_to_end(key)
+            return entry[1]
+
+    def _store_cached_answer(self, key: Optional[str], answer: str):
+        # Không cache fallback hay lỗi LLM - lỗi tạm thời không được "dính" vào cache
+        if key is None or isinstance(answer, LLMErrorText) or is_short_answer(answer):
+            return
+        with self._answer_cache_lock:
+            self._answer_cache[key] = (time.monotonic() + self.answer_cache_ttl, answer)
+            self._answer_cache.move_to_end(key)
+            while len(self._answer_cache) > self.answer_cache_size:
+                self._answer_cache.popitem(last=False)
+
+    def _format_prompt(self, question: str, **kwargs) -> str:
+        return self._render_prompt(question=question)
+
+    def _build_prompt(self, question: str) -> str:
+        return self._format_prompt(question=question)
+
+    def _build_result(self, answer: str) -> Dict[str, Any]:
+        if is_short_answer(answer):
+            answer = self._get_fallback_answer()
+
+        return {
+            "status": "SUCCESS",
+            "answer": answer,
+            "references": [],
+            "next_agent": "end"
+        }
 
     def process(self, question: str, **kwargs) -> Dict[str, Any]:
         """Non-streaming process"""
         try:
-            from config.settings import settings
-
-            prompt = self._format_prompt(
-                question=question,
-                support_phone=settings.SUPPORT_PHONE
-            )
+            key = self._answer_cache_key(question)
+            answer = self._get_cached_answer(key)
+            if answer is None:
+                answer = llm_model.invoke(self._build_prompt(question))
+                self._store_cached_answer(key, answer)
+            return self._build_result(answer)
+        except Exception as e:
+            return self._error_result()
 
-            answer = llm_model.invoke(prompt)
+    async def aprocess(self, question: str, **kwargs) -> Dict[str, Any]:
+        """Async non-streaming process"""
+        try:
+            key = self._answer_cache_key(question)
+            answer = self._get_cached_answer(key)
+            if answer is None:
+                answer = await llm_model.ainvoke(self._build_prompt(question))
+                self._store_cached_answer(key, answer)
+            return self._build_result(answer)
+        except Exception as e:
+            return self._error_result()
 
-            if not answer or len(answer.strip()) < 10:
-                answer = self._get_fallback_answer()
+    async def process_streaming(self, question: str = "", **kwargs) -> AsyncIterator[str]:
+        key = self._answer_cache_key(question)
+        answer = self._get_cached_answer(key)
+        if answer is not None:
+            logger.info("⚡ OTHER answer cache hit")
+            yield answer
+            return
 
-            return {
-                "status": "SUCCESS",
-                "answer": answer,
-                "references": [],
-                "next_agent": "end"
-            }
+        parts = []
+        try:
+            async for chunk in self._stream_llm(self._format_prompt(question=question)):
+                if isinstance(chunk, LLMErrorText):
+                    # Stream lỗi giữa chừng - trả lỗi cho client nhưng không cache câu trả lời dở
+                    yield chunk
+                    return
+                parts.append(chunk)
+                yield chunk
         except Exception as e:
-            return {
-                "status": "ERROR",
-                "answer": self._get_fallback_answer(),
-                "references": [],
-                "next_agent": "end"
-            }
+            yield self._stream_error(e)
+            return
+
+        self._store_cached_answer(key, "".join(parts))
 
 
 class StreamingNotEnoughInfoAgent(BaseStreamingAgent):
@@ -202,8 +409,6 @@ class StreamingNotEnoughInfoAgent(BaseStreamingAgent):
 
 TÌNH HUỐNG: Hệ thống không tìm thấy thông tin chính xác trong cơ sở dữ liệu để trả lời câu hỏi này.
 
-Câu hỏi người dùng: "{question}"
-
 NHIỆM VỤ CỦA BẠN:
 1. Bạn hãy trả lời với khách hàng "Dựa trên tổng hợp từ các nguồn thông tin, câu trả lời bạn có thể tham khảo như sau":
 2. NHƯNG dựa trên kiến thức chuyên môn của bạn về chuyển đổi số, hãy cung cấp:
@@ -219,38 +424,38 @@ YÊU CẦU:
 
 Số điện thoại hỗ trợ: {support_phone}
 
+Câu hỏi người dùng: "{question}"
+
 Hãy trả lời:"""
 
         super().__init__("NOT_ENOUGH_INFO", prompt_template)
 
-    def _format_prompt(self, question: str, support_phone: str = "", **kwargs) -> str:
-        return self.prompt_template.format(
-            question=question,
-            support_phone=support_phone
-        )
+    def _format_prompt(self, question: str, **kwargs) -> str:
+        return self._render_prompt(question=question)
+
+    def _build_prompt(self, question: str) -> str:
+        return self._format_prompt(question=question)
+
+    def _build_result(self, answer: str) -> Dict[str, Any]:
+        return {
+            "status": "SUCCESS",
+            "answer": answer,
+            "references": GENERAL_KNOWLEDGE_REFERENCES,
+            "next_agent": "end"
+        }
 
     def process(self, question: str, **kwargs) -> Dict[str, Any]:
         """Non-streaming process"""
         try:
-            from config.settings import settings
-
-            prompt = self._format_prompt(
-                question=question,
-                support_phone=settings.SUPPORT_PHONE
-            )
-
-            answer = llm_model.invoke(prompt)
+            answer = llm_model.invoke(self._build_prompt(question))
+            return self._build_result(answer)
+        except Exception as e:
+            return self._error_result()
 
-            return {
-                "status": "SUCCESS",
-                "answer": answer,
-                "references": [{"document_id": "llm_knowledge", "type": "GENERAL_KNOWLEDGE"}],
-                "next_agent": "end"
-            }
+    async def aprocess(self, question: str, **kwargs) -> Dict[str, Any]:
+        """Async non-streaming process"""
+        try:
+            answer = await llm_model.ainvoke(self._build_prompt(question))
+            return self._build_result(answer)
         except Exception as e:
-            return {
-                "status": "ERROR",
-                "answer": self._get_fallback_answer(),
-                "references": [],
-                "next_agent": "end"
-            }
\ No newline at end of file
+            return self._error_result()
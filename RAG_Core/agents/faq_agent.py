@@ -1,24 +1,56 @@
 # RAG_Core/agents/faq_agent.py (NO FALLBACK VERSION)
 
-from typing import Dict, Any, List
-from models.llm_model import llm_model
-from tools.vector_search import search_faq, rerank_faq
+from typing import Dict, Any, List, Optional, Tuple
+from models.llm_model import llm_model, LLMErrorText
+from tools.vector_search import search_and_rerank
 from config.settings import settings
+from utils.helpers import compile_prompt, is_short_answer
 import logging
+import asyncio
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
+# Template một FAQ trong prompt - bound method .format tạo một lần khi load module
+_FAQ_LINE = "FAQ {i} (Rerank: {r:.3f}, Similarity: {s:.3f}):\nQ: {q}\nA: {a}\n".format
+
 
 class FAQAgent:
-    def __init__(self):
+    # Tìm marker NOT_FOUND trực tiếp trên response, không tạo bản upper() của cả chuỗi
+    _NOT_FOUND_RE = re.compile(r"NOT[_ ]?FOUND", re.IGNORECASE)
+
+    def __init__(
+            self,
+            vector_threshold: float = 0.5,
+            rerank_threshold: float = 0.6,
+            direct_answer_threshold: float = 0.75,
+            force_similarity_threshold: float = 0.85,
+            use_llm: bool = True,
+            rerank_top_k: int = 20
+    ):
         self.name = "FAQ"
 
         # Ngưỡng cho các giai đoạn khác nhau
-        self.vector_threshold = 0.5
-        self.rerank_threshold = 0.6
-        self.direct_answer_threshold = 0.75
-        self.force_similarity_threshold = 0.85
-        self.use_llm = True
+        self.vector_threshold = vector_threshold
+        self.rerank_threshold = rerank_threshold
+        self.direct_answer_threshold = direct_answer_threshold
+        self.force_similarity_threshold = force_similarity_threshold
+        self.use_llm = use_llm
+        self.rerank_top_k = rerank_top_k  # Số FAQ tối đa đưa vào cross-encoder
+
+        # Cache câu trả lời DIRECT theo câu hỏi đã chuẩn hóa (LRU + TTL).
+        # Nhánh LLM không cache; TTL giới hạn độ cũ khi FAQ được sửa ở service khác
+        self.answer_cache_size = 1024
+        self.answer_cache_ttl = 300
+        self._answer_cache = OrderedDict()
+        self._answer_cache_lock = threading.Lock()
+
+        # Single-flight: các request async cùng câu hỏi (đã chuẩn hóa) chờ chung một lượt xử lý
+        self._inflight: Dict[str, asyncio.Future] = {}
 
         self.standard_prompt = """Bạn là một chuyên viên tư vấn khách hàng người Việt Nam thân thiện và chuyên nghiệp.
 
@@ -36,6 +68,8 @@ Hướng dẫn:
 
 Trả lời:"""
 
+        self._render_standard = compile_prompt(self.standard_prompt)
+
     def process(
             self,
             question: str,
@@ -48,152 +82,319 @@ Trả lời:"""
         Nếu reranking fail → propagate error
         """
         try:
-            # ===============================================
-            # BƯỚC 1: VECTOR SEARCH
-            # ===============================================
-            logger.info(f"Step 1: Vector search for FAQ with threshold={self.vector_threshold}")
-            faq_results = search_faq.invoke({"query": question})
-
-            if not faq_results or "error" in str(faq_results):
-                logger.warning("FAQ vector search failed or returned error")
-                return self._route_to_retriever("Vector search failed")
-
-            # Lọc theo vector threshold
-            filtered_faqs = [
-                faq for faq in faq_results
-                if faq.get("similarity_score", 0) >= self.vector_threshold
-            ]
-
-            if not filtered_faqs:
-                logger.info(f"No FAQ passed vector threshold {self.vector_threshold}")
-                return self._route_to_retriever("No FAQ above vector threshold")
-
-            logger.info(f"Found {len(filtered_faqs)} FAQs above vector threshold")
-
-            # ===============================================
-            # BƯỚC 2: RERANK (NO FALLBACK)
-            # ===============================================
-            logger.info("Step 2: Reranking FAQs with cross-encoder")
-
-            reranked_faqs = rerank_faq.invoke({
-                "query": question,
-                "faq_results": filtered_faqs
-            })
-
-            if not reranked_faqs:
-                logger.error("❌ Reranking returned empty results - should not happen")
-                raise RuntimeError("FAQ reranking failed: empty results")
-
-            best_faq = reranked_faqs[0]
-            rerank_score = best_faq.get("rerank_score", 0)
-            similarity_score = best_faq.get("similarity_score", 0)
+            result, prompt, best_faq = self._search_and_decide(question)
+            if result is not None:
+                return result
 
-            logger.info(
-                f"Best FAQ: rerank={rerank_score:.3f}, similarity={similarity_score:.3f}"
-            )
-
-            # ===============================================
-            # BƯỚC 3: CHECK THRESHOLD
-            # ===============================================
-            is_confident = (
-                similarity_score >= self.force_similarity_threshold
-            )
+            response = self._generate_answer(prompt)
+            return self._build_llm_result(response, best_faq)
 
-            if not is_confident:
-                logger.info(
-                    f"Rerank {rerank_score:.3f} < {self.rerank_threshold} AND "
-                    f"similarity {similarity_score:.3f} < {self.force_similarity_threshold} → RETRIEVER"
-                )
-                return self._route_to_retriever(
-                    f"Not confident: rerank={rerank_score:.3f}, sim={similarity_score:.3f}"
-                )
-
-            # ===============================================
-            # BƯỚC 4: TRẢ LỜI TRỰC TIẾP HAY QUA LLM
-            # ===============================================
-            if (
-                    rerank_score >= self.direct_answer_threshold
-                    or similarity_score >= self.force_similarity_threshold
-            ):
-                logger.info(
-                    f"✅ DIRECT ANSWER: rerank={rerank_score:.3f}, sim={similarity_score:.3f}"
-                )
-
-                answer = self._format_direct_answer(best_faq, question)
-
-                return {
-                    "status": "SUCCESS",
-                    "answer": answer,
-                    "mode": "direct",
-                    "references": [
-                        {
-                            "document_id": best_faq.get("faq_id"),
-                            "type": "FAQ",
-                            "description": best_faq.get("question", "")[:500],  # Thêm description
-                            "rerank_score": round(rerank_score, 4),
-                            "similarity_score": round(similarity_score, 4)
-                        }
-                    ],
-                    "next_agent": "end"
-                }
-
-            # ===============================================
-            # BƯỚC 5: DÙNG LLM
-            # ===============================================
-            logger.info(
-                f"🤖 LLM MODE: rerank={rerank_score:.3f}, sim={similarity_score:.3f}"
-            )
-
-            faq_text = self._format_reranked_faq(reranked_faqs[:3])
-
-            prompt = self.standard_prompt.format(
-                question=question,
-                faq_results=faq_text,
-                rerank_threshold=self.rerank_threshold
-            )
-
-            response = llm_model.invoke(prompt)
+        except RuntimeError as e:
+            # Critical errors (reranking fails) - propagate
+            logger.error(f"❌ Critical FAQ error: {e}")
+            raise
 
-            if "NOT_FOUND" in response.upper():
-                logger.info("LLM determined FAQ not sufficient")
-                return self._route_to_retriever("LLM rejected FAQ")
+        except Exception as e:
+            # Other errors - also propagate
+            logger.error(f"❌ Unexpected error in FAQ agent: {e}", exc_info=True)
+            raise RuntimeError(f"FAQ agent failed: {e}") from e
 
-            if not response or len(response.strip()) < 10:
-                logger.warning("Generated answer too short")
-                return self._route_to_retriever("Answer too short")
+    async def aprocess(
+            self,
+            question: str,
+            is_followup: bool = False,
+            context: str = "",
+            **kwargs
+    ) -> Dict[str, Any]:
+        """
+        Async version của process: search + rerank (sync, CPU/IO) chạy trong thread,
+        bước LLM stream qua llm_model.astream để không chặn event loop.
+        Request trùng câu hỏi đang chạy dùng chung kết quả thay vì rerank + LLM lại
+        """
+        key = self._normalize_question(question)
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                logger.info("⚡ FAQ single-flight: chờ request cùng câu hỏi đang xử lý")
+                return self._copy_result(await asyncio.shield(pending))
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # Request dẫn đầu bị hủy -> tự xử lý
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._aprocess_uncoalesced(question)
+            future.set_result(result)
+            return self._copy_result(result)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # đánh dấu đã retrieve nếu không có ai chờ
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
 
-            logger.info(f"FAQ answer generated via LLM (rerank={rerank_score:.3f})")
+    async def _aprocess_uncoalesced(self, question: str) -> Dict[str, Any]:
+        try:
+            result, prompt, best_faq = await asyncio.to_thread(self._search_and_decide, question)
+            if result is not None:
+                return result
 
-            return {
-                "status": "SUCCESS",
-                "answer": response,
-                "mode": "llm",
-                "references": [
-                    {
-                        "document_id": best_faq.get("faq_id"),
-                        "type": "FAQ",
-                        "description": best_faq.get("question", "")[:500],
-                        "rerank_score": round(rerank_score, 4),
-                        "similarity_score": round(similarity_score, 4)
-                    }
-                ],
-                "next_agent": "end"
-            }
+            response = await self._agenerate_answer(prompt)
+            return self._build_llm_result(response, best_faq)
 
         except RuntimeError as e:
-            # Critical errors (reranking fails) - propagate
             logger.error(f"❌ Critical FAQ error: {e}")
             raise
 
         except Exception as e:
-            # Other errors - also propagate
             logger.error(f"❌ Unexpected error in FAQ agent: {e}", exc_info=True)
             raise RuntimeError(f"FAQ agent failed: {e}") from e
 
+    def _search_and_decide(
+            self,
+            question: str
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str], Optional[Dict[str, Any]]]:
+        """Như _search_and_decide_uncached, trả lời ngay nếu câu hỏi đã có direct answer trong cache"""
+        key = self._normalize_question(question)
+        cached = self._get_cached_answer(key)
+        if cached is not None:
+            logger.info("⚡ FAQ answer cache hit")
+            return cached, None, None
+
+        result, prompt, best_faq = self._search_and_decide_uncached(question)
+        if result is not None and result.get("mode") == "direct":
+            self._store_cached_answer(key, result)
+        return result, prompt, best_faq
+
+    @staticmethod
+    def _normalize_question(question: str) -> str:
+        """NFC + casefold + gộp khoảng trắng/dấu câu; giữ dấu tiếng Việt để không trùng nghĩa"""
+        text = unicodedata.normalize("NFC", question).casefold()
+        return " ".join(re.findall(r"\w+", text))
+
+    def _get_cached_answer(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._answer_cache_lock:
+            entry = self._answer_cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._answer_cache[key]
+                return None
+            self._answer_cache.move_to_end(key)
+            return self._copy_result(entry[1])
+
+    @staticmethod
+    def _copy_result(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Bản sao đủ sâu để caller sửa result/references không ảnh hưởng bản dùng chung"""
+        return {**result, "references": [dict(ref) for ref in result.get("references", [])]}
+
+    def _store_cached_answer(self, key: str, result: Dict[str, Any]):
+        with self._answer_cache_lock:
+            self._answer_cache[key] = (time.monotonic() + self.answer_cache_ttl, result)
+            self._answer_cache.move_to_end(key)
+            while len(self._answer_cache) > self.answer_cache_size:
+                self._answer_cache.popitem(last=False)
+
+    def clear_answer_cache(self):
+        """Xóa cache câu trả lời (gọi khi FAQ index được rebuild)"""
+        with self._answer_cache_lock:
+            self._answer_cache.clear()
+
+    def _search_and_decide_uncached(
+            self,
+            question: str
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Bước 1-4: vector search → rerank → quyết định.
+        Trả về (result, None, None) nếu đã có kết quả cuối,
+        hoặc (None, prompt, best_faq) nếu cần gọi LLM.
+        Rerank phụ thuộc kết quả search nên hai bước này không chạy song song được.
+        """
+        # ===============================================
+        # BƯỚC 1-2: VECTOR SEARCH + FILTER + RERANK (một lần gọi tool)
+        # Similarity đã vượt force_similarity_threshold thì luôn trả lời trực tiếp, không cần
+        # cross-encoder; dưới ngưỡng đó rerank_score quyết định RETRIEVER / DIRECT / LLM
+        # ===============================================
+        logger.info(f"Step 1-2: Search + rerank FAQ with vector threshold={self.vector_threshold}")
+        reranked_faqs = search_and_rerank.invoke({
+            "query": question,
+            "vector_threshold": self.vector_threshold,
+            "skip_rerank_above": self.force_similarity_threshold,
+            "rerank_top_k": self.rerank_top_k
+        })
+
+        if reranked_faqs and "error" in reranked_faqs[0]:
+            logger.warning("FAQ vector search failed or returned error")
+            return self._route_to_retriever("Vector search failed"), None, None
+
+        if not reranked_faqs:
+            logger.info(f"No FAQ passed vector threshold {self.vector_threshold}")
+            return self._route_to_retriever("No FAQ above vector threshold"), None, None
+
+        best_faq = reranked_faqs[0]
+        rerank_score = best_faq.get("rerank_score", 0)
+        similarity_score = best_faq.get("similarity_score", 0)
+
+        logger.info(
+            f"Best FAQ: rerank={rerank_score:.3f}, similarity={similarity_score:.3f}"
+        )
+
+        # ===============================================
+        # BƯỚC 3: CHECK THRESHOLD
+        # ===============================================
+        is_confident = (
+            similarity_score >= self.force_similarity_threshold
+            or rerank_score >= self.rerank_threshold
+        )
+
+        if not is_confident:
+            logger.info(
+                f"Rerank {rerank_score:.3f} < {self.rerank_threshold} AND "
+                f"similarity {similarity_score:.3f} < {self.force_similarity_threshold} → RETRIEVER"
+            )
+            return self._route_to_retriever(
+                f"Not confident: rerank={rerank_score:.3f}, sim={similarity_score:.3f}"
+            ), None, None
+
+        # ===============================================
+        # BƯỚC 4: TRẢ LỜI TRỰC TIẾP HAY QUA LLM
+        # ===============================================
+        if (
+                rerank_score >= self.direct_answer_threshold
+                or similarity_score >= self.force_similarity_threshold
+        ):
+            logger.info(
+                f"✅ DIRECT ANSWER: rerank={rerank_score:.3f}, sim={similarity_score:.3f}"
+            )
+
+            answer = self._format_direct_answer(best_faq, question)
+
+            return {
+                "status": "SUCCESS",
+                "answer": answer,
+                "mode": "direct",
+                "references": [self._faq_reference(best_faq)],
+                "next_agent": "end"
+            }, None, None
+
+        # ===============================================
+        # BƯỚC 5: DÙNG LLM
+        # ===============================================
+        logger.info(
+            f"🤖 LLM MODE: rerank={rerank_score:.3f}, sim={similarity_score:.3f}"
+        )
+
+        faq_text = self._format_reranked_faq(self._select_prompt_faqs(reranked_faqs))
+
+        prompt = self._render_standard(
+            question=question,
+            faq_results=faq_text,
+            rerank_threshold=self.rerank_threshold
+        )
+
+        return None, prompt, best_faq
+
+    def _generate_answer(self, prompt: str) -> Optional[str]:
+        """Stream câu trả lời LLM, dừng generate ngay khi gặp NOT_FOUND hoặc lỗi LLM (trả về None)"""
+        parts = []
+        tail = ""
+        stream = llm_model.stream(prompt)
+        try:
+            for chunk in stream:
+                if isinstance(chunk, LLMErrorText):
+                    logger.warning("FAQ LLM generation failed")
+                    return None
+                parts.append(chunk)
+                # Giữ một đoạn đuôi để bắt marker bị cắt ngang giữa hai chunk
+                window = tail + chunk
+                if self._NOT_FOUND_RE.search(window):
+                    return None
+                tail = window[-16:]
+        finally:
+            stream.close()
+
+        return "".join(parts)
+
+    async def _agenerate_answer(self, prompt: str) -> Optional[str]:
+        """Async version của _generate_answer"""
+        parts = []
+        tail = ""
+        stream = llm_model.astream(prompt)
+        try:
+            async for chunk in stream:
+                if isinstance(chunk, LLMErrorText):
+                    logger.warning("FAQ LLM generation failed")
+                    return None
+                parts.append(chunk)
+                window = tail + chunk
+                if self._NOT_FOUND_RE.search(window):
+                    return None
+                tail = window[-16:]
+        finally:
+            await stream.aclose()
+
+        return "".join(parts)
+
+    def _build_llm_result(self, response: Optional[str], best_faq: Dict[str, Any]) -> Dict[str, Any]:
+        """Kiểm tra câu trả lời LLM và đóng gói kết quả"""
+        if response is None:
+            logger.info("LLM determined FAQ not sufficient (or generation failed)")
+            return self._route_to_retriever("LLM rejected FAQ")
+
+        if is_short_answer(response):
+            logger.warning("Generated answer too short")
+            return self._route_to_retriever("Answer too short")
+
+        logger.info(f"FAQ answer generated via LLM (rerank={best_faq.get('rerank_score', 0):.3f})")
+
+        return {
+            "status": "SUCCESS",
+            "answer": response,
+            "mode": "llm",
+            "references": [self._faq_reference(best_faq)],
+            "next_agent": "end"
+        }
+
     # ===============================================================
     # Helper Functions
     # ===============================================================
 
+    def _faq_reference(self, faq: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "document_id": faq.get("faq_id"),
+            "type": "FAQ",
+            "description": faq.get("question", "")[:500],
+            "rerank_score": round(faq.get("rerank_score", 0), 4),
+            "similarity_score": round(faq.get("similarity_score", 0), 4)
+        }
+
+    def _select_prompt_faqs(self, reranked_faqs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Top-1 cách xa top-2 thì chỉ cần 1 FAQ; điểm sát nhau mới gửi 2-3 FAQ cho LLM"""
+        if len(reranked_faqs) < 2:
+            return reranked_faqs
+
+        # Chỉ đo gap trên điểm cross-encoder thật - khi rerank bị bỏ qua (hoặc không có
+        # reranker) rerank_score chỉ là similarity chép sang, giữ đủ 3 FAQ như trước
+        top = reranked_faqs[0]
+        if top.get("rerank_skipped") or "rerank_score" not in top:
+            return reranked_faqs[:3]
+
+        gap = reranked_faqs[0].get("rerank_score", 0) - reranked_faqs[1].get("rerank_score", 0)
+        if gap > 0.15:
+            k = 1
+        elif gap > 0.05:
+            k = 2
+        else:
+            k = 3
+        return reranked_faqs[:k]
+
     def _format_direct_answer(self, faq: Dict[str, Any], question: str) -> str:
         """Format câu trả lời trực tiếp"""
         return f"{faq.get('answer', '')}"
@@ -203,20 +404,16 @@ Trả lời:"""
         if not faq_results:
             return "Không tìm thấy FAQ phù hợp"
 
-        formatted_lines = []
-        for i, faq in enumerate(faq_results, 1):
-            question = faq.get('question', '')
-            answer = faq.get('answer', '')
-            rerank_score = faq.get('rerank_score', 0)
-            similarity_score = faq.get('similarity_score', 0)
-
-            formatted_lines.append(
-                f"FAQ {i} (Rerank: {rerank_score:.3f}, Similarity: {similarity_score:.3f}):\n"
-                f"Q: {question}\n"
-                f"A: {answer}\n"
+        return "\n".join([
+            _FAQ_LINE(
+                i=i,
+                r=faq.get('rerank_score', 0),
+                s=faq.get('similarity_score', 0),
+                q=faq.get('question', ''),
+                a=faq.get('answer', '')
             )
-
-        return "\n".join(formatted_lines)
+            for i, faq in enumerate(faq_results, 1)
+        ])
 
     def _route_to_retriever(self, reason: str) -> Dict[str, Any]:
         logger.info(f"Routing to RETRIEVER: {reason}")
@@ -232,7 +429,8 @@ Trả lời:"""
             vector_threshold: float = None,
             rerank_threshold: float = None,
             direct_answer_threshold: float = None,
-            use_llm: bool = None
+            use_llm: bool = None,
+            rerank_top_k: int = None
     ):
         if vector_threshold is not None:
             self.vector_threshold = vector_threshold
@@ -248,4 +446,11 @@ Trả lời:"""
 
         if use_llm is not None:
             self.use_llm = use_llm
-            logger.info(f"Use LLM mode: {use_llm}")
\ No newline at end of file
+            logger.info(f"Use LLM mode: {use_llm}")
+
+        if rerank_top_k is not None:
+            self.rerank_top_k = rerank_top_k
+            logger.info(f"Rerank top-k updated to {rerank_top_k}")
+
+        # Ngưỡng đổi → các direct answer đã cache có thể không còn đúng
+        self.clear_answer_cache()
\ No newline at end of file
@@ -1,7 +1,9 @@
 # RAG_Core/agents/generator_agent.py - FIXED STREAMING VERSION
 
-from typing import Dict, Any, List, AsyncIterator
+from typing import Dict, Any, List, AsyncIterator, Optional, Tuple
 from models.llm_model import llm_model
+from utils.helpers import compile_prompt, is_short_answer
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -57,21 +59,21 @@ Hãy trả lời như đang nói chuyện trực tiếp với khách hàng:"""
 
 Hãy trả lời:"""
 
+        self._render_standard = compile_prompt(self.standard_prompt)
+        self._render_followup = compile_prompt(self.followup_prompt)
+
     def _deduplicate_references(self, references: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Loại bỏ references trùng lặp"""
+        """Loại bỏ references trùng lặp (giữ lần xuất hiện đầu tiên, đúng thứ tự)"""
         if not references:
             return []
 
-        seen_doc_ids = set()
-        unique_references = []
-
+        unique_references = {}
         for ref in references:
             doc_id = ref.get('document_id')
-            if doc_id and doc_id not in seen_doc_ids:
-                seen_doc_ids.add(doc_id)
-                unique_references.append(ref)
+            if doc_id:
+                unique_references.setdefault(doc_id, ref)
 
-        return unique_references
+        return list(unique_references.values())
 
     def _format_documents(self, documents: List[Dict[str, Any]]) -> str:
         """Format documents thành text"""
@@ -86,67 +88,92 @@ Hãy trả lời:"""
 
         return "\n\n".join(doc_lines)
 
-    def _format_history(self, history: List, max_turns: int = 2) -> str:
-        """Format lịch sử hội thoại"""
-        if not history:
-            return "Không có lịch sử"
+    def _normalize_history(self, history: List) -> Tuple[List[Tuple[str, str]], str, str]:
+        """
+        Normalize history một lần duy nhất.
+
+        Returns:
+            (messages dạng (role, content), câu hỏi user gần nhất,
+             câu trả lời assistant đầu tiên sau câu hỏi đó)
+        """
+        messages = []
+        prev_question = None
+        prev_answer = None
 
-        # Normalize history
-        normalized_history = []
-        for msg in history:
+        for msg in history or []:
             if isinstance(msg, dict):
-                normalized_history.append({
-                    "role": msg.get("role", ""),
-                    "content": msg.get("content", "")
-                })
+                role = msg.get("role", "")
+                content = msg.get("content", "")
             else:
-                normalized_history.append({
-                    "role": getattr(msg, "role", ""),
-                    "content": getattr(msg, "content", "")
-                })
+                role = getattr(msg, "role", "")
+                content = getattr(msg, "content", "")
+            messages.append((role, content))
 
-        # Lấy N turn gần nhất
-        recent_history = normalized_history[-(max_turns * 2):] if len(
-            normalized_history) > max_turns * 2 else normalized_history
+            if role == "user":
+                prev_question = content
+                prev_answer = None
+            elif role == "assistant" and prev_question is not None and prev_answer is None:
+                prev_answer = content
 
+        return messages, prev_question, prev_answer
+
+    def _format_history(self, messages: List[Tuple[str, str]], max_turns: int = 2) -> str:
+        """Format lịch sử hội thoại (đã normalize)"""
         history_lines = []
-        for msg in recent_history:
-            role = "👤 Khách hàng" if msg.get("role") == "user" else "🤖 Trợ lý"
-            content = msg.get("content", "")
+        for role, content in messages[-(max_turns * 2):]:
             if content:
-                history_lines.append(f"{role}: {content}")
+                speaker = "👤 Khách hàng" if role == "user" else "🤖 Trợ lý"
+                history_lines.append(f"{speaker}: {content}")
 
         return "\n".join(history_lines) if history_lines else "Không có lịch sử"
 
-    def _extract_context_summary(self, history: List) -> str:
-        """Trích xuất context summary"""
-        if not history or len(history) < 2:
+    def _extract_context_summary(
+            self,
+            messages: List[Tuple[str, str]],
+            prev_question: Optional[str],
+            prev_answer: Optional[str]
+    ) -> str:
+        """Trích xuất context summary (từ kết quả _normalize_history)"""
+        if len(messages) < 2:
             return "Đây là câu hỏi đầu tiên"
 
-        # Normalize history
-        normalized_history = []
-        for msg in history:
-            if isinstance(msg, dict):
-                normalized_history.append(msg)
-            else:
-                normalized_history.append({
-                    "role": getattr(msg, "role", ""),
-                    "content": getattr(msg, "content", "")
-                })
-
-        # Lấy câu hỏi trước
-        for i in range(len(normalized_history) - 1, -1, -1):
-            if normalized_history[i].get("role") == "user":
-                prev_question = normalized_history[i].get("content", "")
+        if prev_question is None:
+            return "Đang trong cuộc trò chuyện"
 
-                for j in range(i + 1, len(normalized_history)):
-                    if normalized_history[j].get("role") == "assistant":
-                        prev_answer = normalized_history[j].get("content", "")
-                        return f"Chủ đề đang thảo luận: {prev_question}\nĐã trả lời: {prev_answer[:200]}..."
+        if prev_answer is not None:
+            return f"Chủ đề đang thảo luận: {prev_question}\nĐã trả lời: {prev_answer[:200]}..."
 
-                return f"Chủ đề đang thảo luận: {prev_question}"
+        return f"Chủ đề đang thảo luận: {prev_question}"
 
-        return "Đang trong cuộc trò chuyện"
+    def _build_prompt(
+            self,
+            question: str,
+            documents: List[Dict[str, Any]],
+            history: List = None,
+            is_followup: bool = False,
+            context_summary: str = ""
+    ) -> str:
+        """Format documents + history và render prompt tương ứng"""
+        doc_text = self._format_documents(documents)
+        messages, prev_question, prev_answer = self._normalize_history(history)
+        history_text = self._format_history(messages, max_turns=2)
+
+        if is_followup:
+            if not context_summary:
+                context_summary = self._extract_context_summary(messages, prev_question, prev_answer)
+
+            return self._render_followup(
+                question=question,
+                context_summary=context_summary,
+                recent_history=history_text,
+                documents=doc_text
+            )
+
+        return self._render_standard(
+            question=question,
+            history=history_text,
+            documents=doc_text
+        )
 
     def process(
             self,
@@ -168,31 +195,14 @@ Hãy trả lời:"""
                     "next_agent": "end"
                 }
 
-            doc_text = self._format_documents(documents)
-            history_text = self._format_history(history or [], max_turns=2)
-
-            # Chọn prompt
-            if is_followup:
-                if not context_summary:
-                    context_summary = self._extract_context_summary(history or [])
-
-                prompt = self.followup_prompt.format(
-                    question=question,
-                    context_summary=context_summary,
-                    recent_history=history_text,
-                    documents=doc_text
-                )
-            else:
-                prompt = self.standard_prompt.format(
-                    question=question,
-                    history=history_text,
-                    documents=doc_text
-                )
+            prompt = self._build_prompt(
+                question, documents, history, is_followup, context_summary
+            )
 
             # Generate answer (non-streaming)
             answer = llm_model.invoke(prompt)
 
-            if not answer or len(answer.strip()) < 10:
+            if is_short_answer(answer):
                 answer = "Tôi đã tìm thấy thông tin liên quan nhưng gặp khó khăn trong việc tạo câu trả lời."
 
             unique_references = self._deduplicate_references(references or [])
@@ -235,27 +245,10 @@ Hãy trả lời:"""
                 yield "Không có tài liệu để tạo câu trả lời."
                 return
 
-            # Format inputs
-            doc_text = self._format_documents(documents)
-            history_text = self._format_history(history or [], max_turns=2)
-
-            # Choose prompt
-            if is_followup:
-                if not context_summary:
-                    context_summary = self._extract_context_summary(history or [])
-
-                prompt = self.followup_prompt.format(
-                    question=question,
-                    context_summary=context_summary,
-                    recent_history=history_text,
-                    documents=doc_text
-                )
-            else:
-                prompt = self.standard_prompt.format(
-                    question=question,
-                    history=history_text,
-                    documents=doc_text
-                )
+            # Format inputs ngoài event loop - các stream khác vẫn relay token trong lúc này
+            prompt = await asyncio.to_thread(
+                self._build_prompt, question, documents, history, is_followup, context_summary
+            )
 
             logger.info(f"📝 Generator: Prompt prepared, length={len(prompt)}")
 
@@ -264,7 +257,7 @@ Hãy trả lời:"""
             async for chunk in llm_model.astream(prompt):
                 if chunk:  # Only yield non-empty chunks
                     chunk_count += 1
-                    logger.debug(f"Generator yielding chunk #{chunk_count}: {chunk[:30]}...")
+                    logger.debug("Generator yielding chunk #%d: %.30s...", chunk_count, chunk)
                     yield chunk
 
             logger.info(f"✅ Generator: Completed streaming {chunk_count} chunks")
@@ -1,9 +1,10 @@
 # RAG_Core/agents/grader_agent.py (NO FALLBACK VERSION)
 
 from typing import Dict, Any, List
-from tools.vector_search import rerank_documents
+from tools.vector_search import rerank_documents, scores_array, top_by_similarity
 from config.settings import settings
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +13,7 @@ class GraderAgent:
     def __init__(self):
         self.name = "GRADER"
         self.reranking_threshold = 0.5
+        self.rerank_top_k = 50  # Số tài liệu tối đa đưa vào cross-encoder
 
     def process(self, question: str, documents: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
         """
@@ -33,31 +35,24 @@ class GraderAgent:
 
             reranked_docs = rerank_documents.invoke({
                 "query": question,
-                "documents": documents
+                "documents": top_by_similarity(documents, self.rerank_top_k)
             })
 
             if not reranked_docs:
                 logger.error("❌ Reranking returned empty results - this should not happen")
                 raise RuntimeError("Reranking failed: empty results")
 
-            # Bước 2: Lọc documents theo 2 tiêu chí
-            qualified_docs = []
-            for doc in reranked_docs:
-                rerank_score = doc.get("rerank_score", 0)
-                similarity_score = doc.get("similarity_score", 0)
+            # Bước 2: Lọc documents theo 2 tiêu chí - kiểm tra CẢ HAI điểm số bằng mask
+            reranks = scores_array(reranked_docs, "rerank_score")
+            sims = scores_array(reranked_docs, "similarity_score")
+            mask = (reranks >= np.float32(self.reranking_threshold)) & (sims >= np.float32(settings.SIMILARITY_THRESHOLD))
+            qualified_docs = [reranked_docs[i] for i in np.flatnonzero(mask)]
 
-                # Kiểm tra CẢ HAI điểm số
-                if (rerank_score >= self.reranking_threshold and
-                        similarity_score >= settings.SIMILARITY_THRESHOLD):
-                    qualified_docs.append(doc)
+            if logger.isEnabledFor(logging.DEBUG):
+                for doc, sim, rerank, ok in zip(reranked_docs, sims, reranks, mask):
                     logger.debug(
-                        f"Doc {doc.get('document_id')}: "
-                        f"similarity={similarity_score:.3f}, rerank={rerank_score:.3f} ✓"
-                    )
-                else:
-                    logger.debug(
-                        f"Doc {doc.get('document_id')}: "
-                        f"similarity={similarity_score:.3f}, rerank={rerank_score:.3f} ✗"
+                        "Doc %s: similarity=%.3f, rerank=%.3f %s",
+                        doc.get('document_id'), sim, rerank, '✓' if ok else '✗'
                     )
 
             # Bước 3: Quyết định
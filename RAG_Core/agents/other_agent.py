@@ -1,6 +1,7 @@
 from typing import Dict, Any, List
 from models.llm_model import llm_model
 from config.settings import settings
+from utils.helpers import compile_prompt
 
 
 class OtherAgent:
@@ -10,24 +11,26 @@ class OtherAgent:
 
 Nhiệm vụ: Thông báo lịch sự khi yêu cầu nằm ngoài phạm vi và hướng dẫn khách hàng.
 
-Yêu cầu của khách hàng: "{question}"
-Số điện thoại hỗ trợ: {support_phone}
-
 Hướng dẫn:
 1. Giải thích rằng yêu cầu nằm ngoài phạm vi hỗ trợ hiện tại
 2. Đề xuất liên hệ hotline để được tư vấn cụ thể hơn
 3. Giữ thái độ lịch sự và chuyên nghiệp
 4. Không từ chối một cách thô lỗ
 
+Số điện thoại hỗ trợ: {support_phone}
+Yêu cầu của khách hàng: "{question}"
+
 Trả lời:"""
 
+        # support_phone không đổi - điền sẵn một lần, mỗi request chỉ ghép {question}
+        self._render_prompt = compile_prompt(self.prompt_template.replace(
+            "{support_phone}", settings.SUPPORT_PHONE.replace("{", "{{").replace("}", "}}")
+        ))
+
     def process(self, question: str, **kwargs) -> Dict[str, Any]:
         """Xử lý yêu cầu ngoài phạm vi hỗ trợ"""
         try:
-            prompt = self.prompt_template.format(
-                question=question,
-                support_phone=settings.SUPPORT_PHONE
-            )
+            prompt = self._render_prompt(question=question)
 
             answer = llm_model.invoke(prompt)
 
@@ -1,7 +1,8 @@
 from typing import Dict, Any, List
 from models.llm_model import llm_model
-from tools.vector_search import search_documents
+from tools.vector_search import search_documents, scores_array
 from config.settings import settings
+import numpy as np
 
 
 class RetrieverAgent:
@@ -15,18 +16,18 @@ class RetrieverAgent:
             # Tìm kiếm tài liệu
             search_results = search_documents.invoke({"query": question})
 
-            if not search_results or "error" in str(search_results):
+            # search_documents báo lỗi bằng [{"error": ...}] - chỉ kiểm tra key, không str() cả list
+            if not search_results or "error" in search_results[0]:
                 return {
                     "status": "ERROR",
                     "documents": [],
                     "next_agent": "NOT_ENOUGH_INFO"
                 }
 
-            # Lọc kết quả theo similarity threshold
-            relevant_docs = [
-                doc for doc in search_results
-                if doc.get("similarity_score", 0) > settings.SIMILARITY_THRESHOLD
-            ]
+            # Lọc kết quả theo similarity threshold bằng mask
+            sims = scores_array(search_results, "similarity_score")
+            mask = sims > np.float32(settings.SIMILARITY_THRESHOLD)
+            relevant_docs = [search_results[i] for i in np.flatnonzero(mask)]
 
             if not relevant_docs:
                 return {
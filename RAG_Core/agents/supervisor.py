@@ -1,20 +1,90 @@
 # RAG_Core/agents/supervisor.py
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from langchain_core.messages import HumanMessage, SystemMessage
-from models.llm_model import llm_model
+from models.llm_model import llm_model, LLMErrorText
 from tools.vector_search import check_database_connection
 from utils.context_processor import context_processor
+from collections import OrderedDict
+import hashlib
 import logging
 import json
 import re
+import threading
+import time
+import unicodedata
 
 logger = logging.getLogger(__name__)
 
+_JSON_DECODER = json.JSONDecoder()
+
+# Bỏ dấu tiếng Việt (chữ thường) bằng một lần str.translate: nguyên âm có dấu -> ký tự gốc
+# theo NFD, "đ" -> "d"
+_VI_ACCENTED = (
+    "àáạảãâầấậẩẫăằắặẳẵ" "èéẹẻẽêềếệểễ" "ìíịỉĩ"
+    "òóọỏõôồốộổỗơờớợởỡ" "ùúụủũưừứựửữ" "ỳýỵỷỹ"
+)
+_DIACRITIC_MAP = str.maketrans(
+    {c: unicodedata.normalize("NFD", c)[0] for c in _VI_ACCENTED} | {"đ": "d"}
+)
+
+
+def _strip_diacritics(text: str) -> str:
+    return text.translate(_DIACRITIC_MAP)
+
 
 class SupervisorAgent:
+    # Từ khóa cho phân loại dự phòng - mỗi nhóm compile thành một regex alternation
+    # Chatter keywords - cảm xúc tiêu cực
+    _CHATTER_KEYWORDS = (
+        "tệ", "kém", "tồi", "không hài lòng", "giận",
+        "phản đối", "khiếu nại", "thất vọng", "tức giận"
+    )
+    # Reporter keywords - lỗi hệ thống
+    _REPORTER_KEYWORDS = (
+        "lỗi", "không hoạt động", "bị lỗi", "không kết nối",
+        "không truy cập được", "hỏng", "không phản hồi"
+    )
+    _CHATTER_RE = re.compile("|".join(map(re.escape, _CHATTER_KEYWORDS)))
+    _REPORTER_RE = re.compile("|".join(map(re.escape, _REPORTER_KEYWORDS)))
+    # Bản không dấu cho người gõ thiếu dấu ("khong hai long"). Chỉ lấy cụm nhiều âm tiết:
+    # từ đơn bỏ dấu thì trùng nghĩa khác ("tồi" -> "toi" = "tôi", "hỏng" nằm trong "khong")
+    _CHATTER_PLAIN_RE = re.compile(
+        r"\b(?:%s)\b" % "|".join(re.escape(_strip_diacritics(k)) for k in _CHATTER_KEYWORDS if " " in k)
+    )
+    _REPORTER_PLAIN_RE = re.compile(
+        r"\b(?:%s)\b" % "|".join(re.escape(_strip_diacritics(k)) for k in _REPORTER_KEYWORDS if " " in k)
+    )
+
+    # Dấu hiệu rõ ràng (độ chính xác cao) -> route luôn, không gọi LLM. Chỉ từ khóa đơn
+    # như "lỗi" thì không đủ: "cách sửa lỗi Excel" vẫn là câu hỏi FAQ. Chỉ lấy từ chỉ cảm xúc;
+    # "khiếu nại", "phản đối" là chủ đề ("thủ tục khiếu nại trên Cổng DVC") nên để LLM phân loại
+    _RULE_CHATTER_RE = re.compile(
+        r"(?<!\w)(?:" + "|".join(map(re.escape, ("không hài lòng", "thất vọng", "tức giận"))) + r")(?!\w)"
+    )
+    # REPORTER chỉ khi người dùng báo lỗi của chính bot này ("hệ thống này bị lỗi"), không phải
+    # hỏi về lỗi website/hệ thống nói chung ("website bị lỗi 404", "hệ thống lỗi thời")
+    _RULE_REPORTER_RE = re.compile(
+        r"(?<!\w)(?:hệ thống|chatbot|bot|website|trang web)\s+(?:này|của bạn|của các bạn)\s+"
+        r"(?:đang\s+)?(?:bị\s+)?"
+        r"(?:lỗi(?!\s*thời)|hỏng|không hoạt động|không phản hồi|mất kết nối|không truy cập được)(?!\w)"
+    )
+    # Câu hỏi cách làm / hỏi đáp ("cách khắc phục...", "xử lý ... thế nào") là FAQ dù chứa
+    # từ khóa cảm xúc hay lỗi -> không route bằng rule, để LLM phân loại
+    _RULE_QUESTION_RE = re.compile(
+        r"(?<!\w)(?:cách|hướng dẫn|làm sao|làm thế nào|thế nào|khắc phục|sửa|là gì)(?!\w)"
+    )
+
     def __init__(self):
         self.name = "SUPERVISOR"
+
+        # Cache kết quả phân loại theo hash của prompt đầy đủ (câu hỏi + ngữ cảnh + lịch sử):
+        # cùng đầu vào -> cùng agent, bỏ qua lượt gọi LLM (LRU + TTL). Chỉ cache kết quả LLM
+        # parse được - lỗi LLM / response hỏng không được "dính" vào cache
+        self.classification_cache_size = 4096
+        self.classification_cache_ttl = 300
+        self._classification_cache = OrderedDict()
+        self._classification_cache_lock = threading.Lock()
         self.classification_prompt = """Bạn là chuyên viên đào tạo kỹ năng chuyển đổi số, kiến thức sử dụng công nghệ thông tin cơ bản cho người dân - người điều phối chính của hệ thống chatbot.
 
 Nhiệm vụ:
@@ -32,6 +102,13 @@ Các agent có thể chọn:
 - CHATTER: Người dùng có dấu hiệu không hài lòng, giận dữ, hoặc cần được an ủi, làm dịu.
 - REPORTER: Khi người dùng phản ánh lỗi, mất kết nối, hoặc vấn đề kỹ thuật của hệ thống.
 
+Hãy trả lời đúng định dạng JSON:
+{{
+  "context_summary": "Tóm tắt ngắn gọn ngữ cảnh (nếu có)",
+  "agent": "FAQ" hoặc "CHATTER" hoặc "REPORTER" hoặc "OTHER",
+  "reasoning": "Lý do chọn agent này"
+}}
+
 Đầu vào:
 Câu hỏi gốc: "{original_question}"
 Câu hỏi đã được làm rõ ngữ cảnh: "{contextualized_question}"
@@ -40,15 +117,16 @@ Trạng thái hệ thống: {system_status}
 Có phải follow-up question: {is_followup}
 Context liên quan: {relevant_context}
 
-Hãy trả lời đúng định dạng JSON:
-{{
-  "context_summary": "Tóm tắt ngắn gọn ngữ cảnh (nếu có)",
-  "agent": "FAQ" hoặc "CHATTER" hoặc "REPORTER" hoặc "OTHER",
-  "reasoning": "Lý do chọn agent này"
-}}
-
 Chỉ trả về JSON, không thêm text nào khác."""
 
+        # Hướng dẫn + danh sách agent + JSON schema đứng trước mọi placeholder -> prefix giống hệt
+        # giữa các request, Ollama dùng lại KV cache của phần này
+        self._prefix = self.classification_prompt.split("Đầu vào:", 1)[0].replace("{{", "{").replace("}}", "}")
+
+    async def warm_prefix(self) -> bool:
+        """Prefill sẵn phần prefix tĩnh của prompt phân loại trên LLM server"""
+        return await llm_model.awarm_prefix(self._prefix)
+
     def classify_request(
             self,
             question: str,
@@ -77,6 +155,18 @@ Chỉ trả về JSON, không thêm text nào khác."""
                     "is_followup": False
                 }
 
+            # Rule layer: câu hỏi có dấu hiệu rõ ràng không cần LLM phân loại/làm rõ ngữ cảnh
+            rule_agent = self._rule_classify(question)
+            if rule_agent is not None:
+                logger.info(f"⚡ Rule route → {rule_agent}")
+                return {
+                    "agent": rule_agent,
+                    "contextualized_question": question,
+                    "context_summary": "",
+                    "is_followup": False,
+                    "reasoning": "Rule match"
+                }
+
             # Xử lý context từ history
             context_info = context_processor.extract_context_from_history(
                 history or [],
@@ -111,11 +201,18 @@ Chỉ trả về JSON, không thêm text nào khác."""
                 relevant_context=relevant_context[:300] if relevant_context else "Không có"
             )
 
-            # Gọi LLM để phân loại
-            response = llm_model.invoke(prompt)
+            # Gọi LLM để phân loại (trừ khi prompt giống hệt đã có trong cache)
+            cache_key = hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).digest()
+            classification = self._get_cached_classification(cache_key)
+            cacheable = False
+            if classification is None:
+                response = llm_model.invoke(prompt)
 
-            # Parse JSON response
-            classification = self._parse_classification_response(response)
+                # Parse JSON response
+                classification = self._parse_classification_response(response)
+                cacheable = classification.get("parsed", True) and not isinstance(response, LLMErrorText)
+            else:
+                logger.info("⚡ Supervisor classification cache hit")
 
             # Validate agent choice
             valid_agents = ["FAQ", "CHATTER", "REPORTER", "OTHER"]
@@ -124,6 +221,8 @@ Chỉ trả về JSON, không thêm text nào khác."""
             if agent_choice not in valid_agents:
                 # Fallback classification
                 agent_choice = self._fallback_classify(contextualized_question)
+            elif cacheable:
+                self._store_cached_classification(cache_key, classification)
 
             return {
                 "agent": agent_choice,
@@ -143,20 +242,45 @@ Chỉ trả về JSON, không thêm text nào khác."""
                 "reasoning": "Fallback due to error"
             }
 
+    def _get_cached_classification(self, key: bytes) -> Optional[Dict[str, Any]]:
+        with self._classification_cache_lock:
+            entry = self._classification_cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._classification_cache[key]
+                return None
+            self._classification_cache.move_to_end(key)
+            return entry[1]
+
+    def _store_cached_classification(self, key: bytes, classification: Dict[str, Any]):
+        with self._classification_cache_lock:
+            self._classification_cache[key] = (time.monotonic() + self.classification_cache_ttl, classification)
+            self._classification_cache.move_to_end(key)
+            while len(self._classification_cache) > self.classification_cache_size:
+                self._classification_cache.popitem(last=False)
+
     def _parse_classification_response(self, response: str) -> Dict[str, Any]:
         """Parse JSON response từ LLM"""
         try:
-            # Tìm JSON block trong response
-            json_match = re.search(r'\{[^}]+\}', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                return json.loads(json_str)
-
-            # Fallback parsing
+            # Tìm JSON object đầu tiên decode được - raw_decode tự cân ngoặc,
+            # kể cả "}" nằm trong string hoặc object lồng nhau
+            start = response.find("{")
+            while start != -1:
+                try:
+                    parsed, _ = _JSON_DECODER.raw_decode(response, start)
+                    if isinstance(parsed, dict):
+                        return parsed
+                except ValueError:
+                    pass
+                start = response.find("{", start + 1)
+
+            # Fallback parsing - "parsed": False để không cache
             return {
                 "agent": "FAQ",
                 "context_summary": "",
-                "reasoning": "Parse failed"
+                "reasoning": "Parse failed",
+                "parsed": False
             }
 
         except Exception as e:
@@ -164,60 +288,51 @@ Chỉ trả về JSON, không thêm text nào khác."""
             return {
                 "agent": "FAQ",
                 "context_summary": "",
-                "reasoning": "Parse error"
+                "reasoning": "Parse error",
+                "parsed": False
             }
 
     def _format_history(self, history: List[Dict[str, str]]) -> str:
-        """Format history thành text, xử lý cả dict và ChatMessage objects"""
-        if not history:
-            return "Không có lịch sử"
-
+        """Format history thành text (dict / ChatMessage đã được normalize thành dict ở đầu workflow)"""
         # Chỉ lấy 3 turn gần nhất (6 messages)
-        recent_history = history[-6:] if len(history) > 6 else history
-
         history_lines = []
-        for msg in recent_history:
-            # Xử lý cả dict và ChatMessage object
-            if isinstance(msg, dict):
-                role = "Người dùng" if msg.get("role") == "user" else "Trợ lý"
-                content = msg.get("content", "")[:200]
-            else:
-                # ChatMessage object
-                role = "Người dùng" if getattr(msg, "role", "") == "user" else "Trợ lý"
-                content = getattr(msg, "content", "")[:200]
-
+        for msg in (history or [])[-6:]:
+            # ChatRequest cho phép history là List[str]: không có role/content -> bỏ qua như trước
+            if not isinstance(msg, dict):
+                continue
+            content = msg.get("content", "")
             if content:
-                history_lines.append(f"{role}: {content}")
+                role = "Người dùng" if msg.get("role") == "user" else "Trợ lý"
+                history_lines.append(f"{role}: {content[:200]}")
 
         return "\n".join(history_lines) if history_lines else "Không có lịch sử"
 
+    def _rule_classify(self, question: str) -> Optional[str]:
+        """CHATTER / REPORTER khi câu hỏi khớp dấu hiệu rõ ràng, None nếu cần LLM"""
+        question_lower = question.lower()
+
+        if self._RULE_QUESTION_RE.search(question_lower):
+            return None
+
+        if self._RULE_CHATTER_RE.search(question_lower):
+            return "CHATTER"
+
+        if self._RULE_REPORTER_RE.search(question_lower):
+            return "REPORTER"
+
+        return None
+
     def _fallback_classify(self, question: str) -> str:
         """Phân loại dự phòng dựa trên từ khóa"""
         question_lower = question.lower()
 
-        # Chatter keywords - cảm xúc tiêu cực
-        chatter_keywords = [
-            "tệ", "kém", "tồi", "không hài lòng", "giận",
-            "phản đối", "khiếu nại", "thất vọng", "tức giận"
-        ]
-        if any(keyword in question_lower for keyword in chatter_keywords):
+        question_plain = _strip_diacritics(question_lower)
+
+        if self._CHATTER_RE.search(question_lower) or self._CHATTER_PLAIN_RE.search(question_plain):
             return "CHATTER"
 
-        # Reporter keywords - lỗi hệ thống
-        reporter_keywords = [
-            "lỗi", "không hoạt động", "bị lỗi", "không kết nối",
-            "không truy cập được", "hỏng", "không phản hồi"
-        ]
-        if any(keyword in question_lower for keyword in reporter_keywords):
+        if self._REPORTER_RE.search(question_lower) or self._REPORTER_PLAIN_RE.search(question_plain):
             return "REPORTER"
 
-        # FAQ keywords - câu hỏi thông thường
-        faq_keywords = [
-            "là gì", "như thế nào", "sao", "tại sao", "có phải",
-            "giờ làm việc", "liên hệ", "hướng dẫn", "cách", "thế nào"
-        ]
-        if any(keyword in question_lower for keyword in faq_keywords):
-            return "FAQ"
-
-        # Default to FAQ for document search
-        return "FAQ"
\ No newline at end of file
+        # Câu hỏi thông thường hoặc không khớp từ khóa nào -> FAQ (document search)
+        return "FAQ"
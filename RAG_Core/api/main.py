@@ -5,16 +5,19 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 import logging
 import os
-from typing import List, AsyncIterator
-import json
+from typing import List, AsyncIterator, Optional
 import asyncio
+import orjson
+import time
 
 from .schemas import (
     ChatRequest, ChatResponse, StreamChunk,
     HealthResponse, DocumentReference
 )
 from workflow.rag_workflow import RAGWorkflow
+from models.llm_model import llm_model
 from database.milvus_client import milvus_client
+from tools.vector_search import search_documents, search_faq
 
 logging.basicConfig(
     level=logging.INFO,
@@ -37,19 +40,76 @@ app.add_middleware(
 )
 
 rag_workflow = None
+# Giữ reference tới task warm-up - event loop chỉ giữ weak reference, task có thể bị GC giữa chừng
+_warmup_task = None
+
+# /health bị load balancer poll liên tục - dùng lại kết quả probe Milvus trong vài giây
+HEALTH_DB_TTL = 2.0
+HEALTH_DB_TIMEOUT = 1.0
+_health_db_status = (0.0, False)
+_health_db_probe: Optional[asyncio.Future] = None
+
+
+async def _cached_db_connected() -> bool:
+    """Probe Milvus ngoài event loop, có TTL; quá HEALTH_DB_TIMEOUT coi như mất kết nối"""
+    global _health_db_status, _health_db_probe
+
+    expires_at, connected = _health_db_status
+    if expires_at >= time.monotonic():
+        return connected
+
+    # Chỉ một probe tại một thời điểm: wait_for không huỷ được thread đang chạy, nên các
+    # poll sau dùng chung probe cũ tới khi nó xong thay vì mỗi lần chiếm thêm một thread
+    if _health_db_probe is None or _health_db_probe.done():
+        _health_db_probe = asyncio.ensure_future(asyncio.to_thread(milvus_client.check_connection))
+
+    try:
+        connected = await asyncio.wait_for(asyncio.shield(_health_db_probe), timeout=HEALTH_DB_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"Database check timed out after {HEALTH_DB_TIMEOUT}s")
+        connected = False
+
+    _health_db_status = (time.monotonic() + HEALTH_DB_TTL, connected)
+    return connected
+
+
+async def _warm_up_retrieval():
+    """Load collection Milvus vào memory + chạy embedding model một lần trước request đầu tiên"""
+    try:
+        await asyncio.to_thread(search_documents.invoke, {"query": "warm up"})
+        await asyncio.to_thread(search_faq.invoke, {"query": "warm up"})
+        logger.info("✅ Retrieval warm-up done")
+    except Exception as e:
+        logger.warning(f"Retrieval warm-up failed: {e}")
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize RAG Workflow on startup"""
-    global rag_workflow
+    global rag_workflow, _warmup_task
     try:
         rag_workflow = RAGWorkflow()
         logger.info("✅ RAG Workflow initialized successfully")
+
+        # Prefill prefix tĩnh của các streaming agent (kéo model Ollama lên) và warm
+        # Milvus + embedding ở background, không chặn startup
+        _warmup_task = asyncio.ensure_future(asyncio.gather(
+            _warm_up_retrieval(),
+            rag_workflow.supervisor.warm_prefix(),
+            rag_workflow.chatter_agent.warm_prefix(),
+            rag_workflow.other_agent.warm_prefix(),
+            rag_workflow.not_enough_info_agent.warm_prefix()
+        ))
     except Exception as e:
         logger.error(f"⚠️  Failed to initialize RAG Workflow: {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Đóng async LLM client dùng chung"""
+    await llm_model.aclose()
+
+
 @app.get("/", response_model=dict)
 async def root():
     """Root endpoint"""
@@ -64,10 +124,20 @@ async def root():
     }
 
 
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+_dumps = orjson.dumps
+
+
+def _sse(event: dict) -> bytes:
+    """Một SSE event - orjson serialize thẳng ra UTF-8 bytes"""
+    return _SSE_PREFIX + _dumps(event) + _SSE_SUFFIX
+
+
 async def generate_streaming_response(
         question: str,
         history: List
-) -> AsyncIterator[str]:
+) -> AsyncIterator[bytes]:
     """
     FIXED: Async generator với proper error handling
     """
@@ -81,8 +151,7 @@ async def generate_streaming_response(
             "references": None,
             "status": "processing"
         }
-        yield f"data: {json.dumps(start_chunk)}\n\n"
-        await asyncio.sleep(0.01)  # Small delay
+        yield _sse(start_chunk)
 
         # Run workflow
         result = await rag_workflow.run_with_streaming(question, history)
@@ -94,6 +163,26 @@ async def generate_streaming_response(
         logger.info(f"📝 Got answer_stream: {answer_stream is not None}")
         logger.info(f"📚 References count: {len(references)}")
 
+        # Send references trước content - retrieval đã xong, client hiển thị nguồn ngay
+        if references:
+            # Convert references to serializable format
+            serializable_refs = []
+            for ref in references:
+                serializable_refs.append({
+                    "document_id": ref.get("document_id", ""),
+                    "type": ref.get("type", "DOCUMENT"),
+                    "description": ref.get("description", "")
+                })
+
+            ref_chunk = {
+                "type": "references",
+                "content": None,
+                "references": serializable_refs,
+                "status": None
+            }
+            yield _sse(ref_chunk)
+            logger.info(f"📚 Sent {len(serializable_refs)} references")
+
         # Stream chunks
         if answer_stream:
             chunk_count = 0
@@ -106,8 +195,7 @@ async def generate_streaming_response(
                         "references": None,
                         "status": None
                     }
-                    yield f"data: {json.dumps(chunk_data)}\n\n"
-                    await asyncio.sleep(0.001)  # Tiny delay for smooth streaming
+                    yield _sse(chunk_data)
 
             logger.info(f"✅ Streamed {chunk_count} chunks")
         else:
@@ -118,27 +206,7 @@ async def generate_streaming_response(
                 "references": None,
                 "status": None
             }
-            yield f"data: {json.dumps(error_chunk)}\n\n"
-
-        # Send references
-        if references:
-            # Convert references to serializable format
-            serializable_refs = []
-            for ref in references:
-                serializable_refs.append({
-                    "document_id": ref.get("document_id", ""),
-                    "type": ref.get("type", "DOCUMENT"),
-                    "description": ref.get("description", "")
-                })
-
-            ref_chunk = {
-                "type": "references",
-                "content": None,
-                "references": serializable_refs,
-                "status": None
-            }
-            yield f"data: {json.dumps(ref_chunk)}\n\n"
-            logger.info(f"📚 Sent {len(serializable_refs)} references")
+            yield _sse(error_chunk)
 
         # Send end chunk
         end_chunk = {
@@ -147,7 +215,7 @@ async def generate_streaming_response(
             "references": None,
             "status": result.get("status", "SUCCESS")
         }
-        yield f"data: {json.dumps(end_chunk)}\n\n"
+        yield _sse(end_chunk)
         logger.info("✅ Streaming completed")
 
     except Exception as e:
@@ -158,7 +226,7 @@ async def generate_streaming_response(
             "references": None,
             "status": "ERROR"
         }
-        yield f"data: {json.dumps(error_chunk)}\n\n"
+        yield _sse(error_chunk)
 
 
 @app.post("/chat")
@@ -188,9 +256,10 @@ async def chat(request: ChatRequest):
                 }
             )
 
-        # NON-STREAMING MODE
+        # NON-STREAMING MODE - workflow async: bước song song không chặn event loop và không
+        # tranh 3 worker của executor dùng chung giữa các request đồng thời
         logger.info("📋 Using non-streaming mode")
-        result = rag_workflow.run(request.question, request.history)
+        result = await rag_workflow.arun(request.question, request.history)
 
         references = []
         for ref in result.get("references", []):
@@ -222,7 +291,7 @@ async def health_check():
     try:
         db_connected = False
         try:
-            db_connected = milvus_client.check_connection()
+            db_connected = await _cached_db_connected()
         except Exception as db_error:
             logger.warning(f"Database check failed: {db_error}")
 
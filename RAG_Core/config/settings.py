@@ -18,6 +18,7 @@ class Settings(BaseSettings):
     # ===== Milvus =====
     MILVUS_HOST: str = "milvus"
     MILVUS_PORT: str = "19530"
+    MILVUS_HNSW_EF: int = 100  # ef khi search index HNSW (tự nâng lên >= top_k)
     DOCUMENT_COLLECTION: str = "document_embeddings"
     FAQ_COLLECTION: str = "faq_embeddings"
 
@@ -25,6 +26,8 @@ class Settings(BaseSettings):
     OLLAMA_URL: str = "http://ollama:11434"
     LLM_MODEL: str = "gpt-oss:20b"
     OLLAMA_BASE_URL: Optional[str] = None
+    OLLAMA_KEEP_ALIVE: str = "30m"  # Giữ model (và prompt cache) trên server giữa các request
+    OLLAMA_NUM_PARALLEL: int = 4  # Khớp với OLLAMA_NUM_PARALLEL của server - số request LLM async đồng thời
 
     # ===== Embedding =====
     EMBEDDING_MODEL: str = "keepitreal/vietnamese-sbert"
@@ -52,6 +55,11 @@ class Settings(BaseSettings):
     FAQ_CONSISTENCY_BONUS: float = 1.1  # Bonus multiplier khi tất cả variants đều cao
     FAQ_CONSISTENCY_THRESHOLD: float = 0.75  # Ngưỡng để được bonus
 
+    # ===== Reranker =====
+    RERANKER_INT8: bool = False  # int8 dynamic quantization cho cross-encoder khi chạy CPU (làm lệch score, cần hiệu chỉnh lại ngưỡng rerank)
+    RERANKER_COMPILE: bool = False  # torch.compile(mode="reduce-overhead") - CUDA graphs khi chạy GPU
+    RERANKER_ONNX_PATH: Optional[str] = None  # model ONNX INT8 đã export sẵn -> chạy ONNX Runtime (CPU), None = dùng torch
+
     # ===== Document Grader Settings =====
     DOCUMENT_RERANK_THRESHOLD: float = 0.6  # Rerank threshold cho documents
 
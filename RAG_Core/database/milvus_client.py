@@ -11,11 +11,18 @@ class MilvusClient:
     def __init__(self):
         self.connected = False
         self.expected_dimension = None  # Will be determined from collection schema
+        self.metric_types = {}  # Cached index metric per collection
+        self.index_types = {}  # Cached index type per collection
         self._connect()
 
     def _connect(self):
         """Connect to Milvus"""
         try:
+            if connections.has_connection("default"):
+                self.connected = True
+                logger.info("Reusing existing Milvus connection")
+                return
+
             connections.connect(
                 alias="default",
                 host=settings.MILVUS_HOST,
@@ -53,6 +60,49 @@ class MilvusClient:
             logger.error(f"Error getting collection dimension: {str(e)}")
             return 0
 
+    def _get_metric_type(self, collection: Collection) -> str:
+        """Get metric type of the collection's vector index (IP for normalized vectors, COSINE for legacy)"""
+        metric_type = self.metric_types.get(collection.name)
+        if metric_type:
+            return metric_type
+
+        metric_type = "IP"
+        try:
+            for index in collection.indexes:
+                if index.params.get("metric_type"):
+                    metric_type = index.params["metric_type"]
+                    break
+        except Exception as e:
+            logger.warning(f"Could not read index metric type of {collection.name}: {e}")
+            return metric_type
+
+        self.metric_types[collection.name] = metric_type
+        return metric_type
+
+    def _get_search_params(self, collection: Collection, top_k: int) -> Dict[str, Any]:
+        """Search params theo loại index: HNSW dùng ef (>= top_k), IVF dùng nprobe"""
+        index_type = self.index_types.get(collection.name)
+        if index_type is None:
+            index_type = ""
+            try:
+                for index in collection.indexes:
+                    if index.params.get("index_type"):
+                        index_type = index.params["index_type"]
+                        break
+                self.index_types[collection.name] = index_type
+            except Exception as e:
+                logger.warning(f"Could not read index type of {collection.name}: {e}")
+
+        if index_type == "HNSW":
+            params = {"ef": max(settings.MILVUS_HNSW_EF, top_k)}
+        else:
+            params = {"nprobe": 16}
+
+        return {
+            "metric_type": self._get_metric_type(collection),
+            "params": params
+        }
+
     def _validate_vector_dimension(self, vector: np.ndarray, collection_name: str, vector_field: str,
                                    auto_fix: bool = True) -> np.ndarray:
         """Validate and potentially adjust vector dimension"""
@@ -121,13 +171,10 @@ class MilvusClient:
                 query_vector, settings.DOCUMENT_COLLECTION, "description_vector"
             )
 
-            search_params = {
-                "metric_type": "COSINE",
-                "params": {"nprobe": 16}  # Changed from nlist to nprobe for search
-            }
+            search_params = self._get_search_params(collection, top_k)
 
             results = collection.search(
-                data=[query_vector.tolist()],
+                data=[query_vector.astype(np.float32, copy=False)],
                 anns_field="description_vector",
                 param=search_params,
                 limit=top_k,
@@ -163,13 +210,10 @@ class MilvusClient:
                 query_vector, settings.FAQ_COLLECTION, "question_vector"
             )
 
-            search_params = {
-                "metric_type": "COSINE",
-                "params": {"nprobe": 16}  # Changed from nlist to nprobe for search
-            }
+            search_params = self._get_search_params(collection, top_k)
 
             results = collection.search(
-                data=[query_vector.tolist()],
+                data=[query_vector.astype(np.float32, copy=False)],
                 anns_field="question_vector",
                 param=search_params,
                 limit=top_k,
@@ -9,9 +9,20 @@ from typing import Iterator, Optional, AsyncIterator
 import logging
 import httpx
 import json
+import asyncio
 
 logger = logging.getLogger(__name__)
 
+# read timeout dài: invoke non-streaming phải chờ generate xong cả câu trả lời
+LLM_HTTP_TIMEOUT = httpx.Timeout(60.0, read=300.0)
+
+
+class LLMErrorText(str):
+    """
+    Thông báo lỗi trả về thay cho câu trả lời khi gọi LLM thất bại. Vẫn là str nên
+    caller cũ không đổi, nhưng cache kiểm tra được bằng isinstance để không lưu lỗi
+    """
+
 
 class LLMModel:
     def __init__(self):
@@ -22,6 +33,7 @@ class LLMModel:
             model=settings.LLM_MODEL,
             base_url=getattr(settings, "OLLAMA_URL", "http://ollama:11434"),
             temperature=0.1,
+            keep_alive=settings.OLLAMA_KEEP_ALIVE,
         )
         self.output_parser = StrOutputParser()
 
@@ -29,14 +41,70 @@ class LLMModel:
         self.ollama_url = getattr(settings, "OLLAMA_URL", "http://ollama:11434")
         self.model_name = settings.LLM_MODEL
 
+        # Sync client dùng chung (keep-alive pool) - không mở kết nối mới cho mỗi invoke
+        self._client = httpx.Client(
+            timeout=LLM_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=max(1, settings.OLLAMA_NUM_PARALLEL))
+        )
+
+        # Async client dùng chung + giới hạn số request đồng thời (tạo lazy trong event loop)
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_slots: Optional[asyncio.Semaphore] = None
+
+    def _generate_payload(self, prompt: str, stream: bool) -> dict:
+        return {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+            "options": {
+                "temperature": 0.1
+            }
+        }
+
     def invoke(self, prompt: str, **kwargs) -> str:
         """Non-streaming invoke"""
         try:
-            resp = self.llm.invoke(prompt, **kwargs)
-            return self.output_parser.parse(resp)
+            response = self._client.post(
+                f"{self.ollama_url}/api/generate",
+                json=self._generate_payload(prompt, stream=False)
+            )
+            response.raise_for_status()
+            return self.output_parser.parse(response.json().get("response", ""))
+        except Exception as e:
+            traceback.print_exc()
+            return LLMErrorText(f"Lỗi xử lý: {str(e)}")
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(timeout=LLM_HTTP_TIMEOUT)
+            self._async_slots = asyncio.Semaphore(max(1, settings.OLLAMA_NUM_PARALLEL))
+        return self._async_client
+
+    async def ainvoke(self, prompt: str, **kwargs) -> str:
+        """
+        Async non-streaming invoke - nhiều request gather() cùng lúc sẽ được
+        Ollama gom batch (tối đa OLLAMA_NUM_PARALLEL)
+        """
+        try:
+            client = self._get_async_client()
+            url = f"{self.ollama_url}/api/generate"
+            payload = self._generate_payload(prompt, stream=False)
+
+            async with self._async_slots:
+                response = await client.post(url, json=payload)
+                response.raise_for_status()
+
+            return self.output_parser.parse(response.json().get("response", ""))
         except Exception as e:
             traceback.print_exc()
-            return f"Lỗi xử lý: {str(e)}"
+            return LLMErrorText(f"Lỗi xử lý: {str(e)}")
+
+    async def aclose(self):
+        """Đóng async client dùng chung"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
 
     def stream(self, prompt: str, **kwargs) -> Iterator[str]:
         """Sync streaming using raw Ollama API"""
@@ -44,16 +112,9 @@ class LLMModel:
             logger.info(f"Starting sync stream with raw Ollama API...")
 
             url = f"{self.ollama_url}/api/generate"
-            payload = {
-                "model": self.model_name,
-                "prompt": prompt,
-                "stream": True,
-                "options": {
-                    "temperature": 0.1
-                }
-            }
+            payload = self._generate_payload(prompt, stream=True)
 
-            with httpx.stream("POST", url, json=payload, timeout=60.0) as response:
+            with self._client.stream("POST", url, json=payload) as response:
                 response.raise_for_status()
 
                 for line in response.iter_lines():
@@ -71,7 +132,7 @@ class LLMModel:
         except Exception as e:
             logger.error(f"Streaming error: {e}")
             traceback.print_exc()
-            yield f"\n\n[Lỗi streaming: {str(e)}]"
+            yield LLMErrorText(f"\n\n[Lỗi streaming: {str(e)}]")
 
     async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
         """
@@ -82,19 +143,13 @@ class LLMModel:
             logger.info(f"📝 Prompt length: {len(prompt)}")
 
             url = f"{self.ollama_url}/api/generate"
-            payload = {
-                "model": self.model_name,
-                "prompt": prompt,
-                "stream": True,
-                "options": {
-                    "temperature": 0.1
-                }
-            }
+            payload = self._generate_payload(prompt, stream=True)
 
             chunk_count = 0
             total_text = ""
 
-            async with httpx.AsyncClient(timeout=60.0) as client:
+            client = self._get_async_client()
+            async with self._async_slots:
                 async with client.stream("POST", url, json=payload) as response:
                     response.raise_for_status()
 
@@ -107,7 +162,7 @@ class LLMModel:
                                 if chunk_text:
                                     chunk_count += 1
                                     total_text += chunk_text
-                                    logger.debug(f"✅ Chunk #{chunk_count}: '{chunk_text[:30]}...'")
+                                    logger.debug("✅ Chunk #%d: '%.30s...'", chunk_count, chunk_text)
                                     yield chunk_text
 
                                 # Check if done
@@ -125,7 +180,37 @@ class LLMModel:
         except Exception as e:
             logger.error(f"❌ Async streaming FAILED: {e}", exc_info=True)
             traceback.print_exc()
-            yield f"\n\n[Lỗi streaming: {str(e)}]"
+            yield LLMErrorText(f"\n\n[Lỗi streaming: {str(e)}]")
+
+    async def awarm_prefix(self, prefix: str) -> bool:
+        """
+        Prefill một prompt prefix tĩnh (num_predict=1) để Ollama giữ model + KV cache
+        của prefix; request sau có cùng prefix chỉ phải prefill phần đuôi
+        """
+        try:
+            url = f"{self.ollama_url}/api/generate"
+            payload = {
+                "model": self.model_name,
+                "prompt": prefix,
+                "stream": False,
+                "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+                "options": {
+                    "temperature": 0.1,
+                    "num_predict": 1
+                }
+            }
+
+            # Dùng client + slot chung: warm-up cũng chiếm một slot OLLAMA_NUM_PARALLEL;
+            # timeout dài hơn mặc định vì lần đầu còn phải load model
+            client = self._get_async_client()
+            async with self._async_slots:
+                response = await client.post(url, json=payload, timeout=120.0)
+                response.raise_for_status()
+            return True
+
+        except Exception as e:
+            logger.warning(f"Prefix warm-up failed: {e}")
+            return False
 
     def create_chain(self, template: str):
         """Create a non-streaming chain"""
@@ -1,34 +1,205 @@
 # RAG_Core/tools/vector_search.py (COMPLETE VERSION)
 
 from langchain_core.tools import tool
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import numpy as np
 from models.embedding_model import embedding_model
 from database.milvus_client import milvus_client
 from sentence_transformers import CrossEncoder
 from config.settings import settings
+from collections import OrderedDict
+import hashlib
+import heapq
 import logging
+import os
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
-# Load reranking model globally
+
+def _quantize_reranker(model: CrossEncoder) -> CrossEncoder:
+    """int8 dynamic quantization cho các Linear layer (chỉ áp dụng trên CPU)"""
+    if not settings.RERANKER_INT8 or model._target_device.type != "cpu":
+        return model
+
+    try:
+        import torch
+
+        model.model = torch.quantization.quantize_dynamic(
+            model.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        logger.info("Reranker quantized to int8 (dynamic)")
+    except Exception as e:
+        logger.warning(f"Reranker int8 quantization skipped: {e}")
+    return model
+
+
+def _compile_reranker(model: CrossEncoder) -> CrossEncoder:
+    """torch.compile reduce-overhead (CUDA graphs) cho cross-encoder trên GPU"""
+    if not settings.RERANKER_COMPILE or model._target_device.type != "cuda":
+        return model
+
+    try:
+        import torch
+
+        model.model = torch.compile(model.model, mode="reduce-overhead", dynamic=False)
+        logger.info("Reranker compiled with torch.compile (reduce-overhead)")
+    except Exception as e:
+        logger.warning(f"Reranker torch.compile skipped: {e}")
+    return model
+
+
+def _warm_up_reranker(model: CrossEncoder) -> CrossEncoder:
+    """Chạy một batch giả lúc load để CUDA context / compile / quantized kernels sẵn sàng"""
+    try:
+        model.predict([["warm up", "warm up"]] * 3, batch_size=3, show_progress_bar=False)
+    except Exception as e:
+        logger.warning(f"Reranker warm-up failed: {e}")
+    return model
+
+
+RERANKER_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+
+class _OnnxCrossEncoder:
+    """Cross-encoder chạy trên ONNX Runtime (CPU) - cùng contract predict() với CrossEncoder"""
+
+    # Pad lên một trong vài độ dài cố định -> session chỉ gặp vài shape
+    SEQ_BUCKETS = (128, 256, 512)
+
+    def __init__(self, onnx_path: str, tokenizer_name: str, max_length: int = 512):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = os.cpu_count() or 1
+        self.session = ort.InferenceSession(
+            onnx_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        self.max_length = max_length
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def predict(self, pairs, batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            features = self.tokenizer(
+                [p[0] for p in batch],
+                [p[1] for p in batch],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            seq_len = features["input_ids"].shape[1]
+            bucket = next((b for b in self.SEQ_BUCKETS if b >= seq_len), seq_len)
+            inputs = {}
+            for name, value in features.items():
+                if name not in self._input_names:
+                    continue
+                pad_value = self.tokenizer.pad_token_id if name == "input_ids" else 0
+                inputs[name] = np.pad(
+                    value.astype(np.int64),
+                    ((0, 0), (0, bucket - seq_len)),
+                    constant_values=pad_value,
+                )
+            logits = self.session.run(None, inputs)[0]
+            # num_labels=1 -> CrossEncoder mặc định áp sigmoid
+            scores.append(1.0 / (1.0 + np.exp(-logits[:, 0])))
+        return np.concatenate(scores).astype(np.float32) if scores else np.empty(0, dtype=np.float32)
+
+
+def _load_reranker():
+    """ONNX Runtime INT8 nếu có RERANKER_ONNX_PATH, ngược lại CrossEncoder (torch)"""
+    if settings.RERANKER_ONNX_PATH:
+        try:
+            model = _OnnxCrossEncoder(settings.RERANKER_ONNX_PATH, RERANKER_MODEL_NAME)
+            logger.info(f"Reranker loaded on ONNX Runtime: {settings.RERANKER_ONNX_PATH}")
+            return model
+        except Exception as e:
+            logger.warning(f"ONNX reranker unavailable, falling back to torch: {e}")
+
+    return _compile_reranker(_quantize_reranker(CrossEncoder(RERANKER_MODEL_NAME)))
+
+
+# Load reranking model globally (một lần, đã warm-up)
 try:
-    reranker_model = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+    reranker_model = _warm_up_reranker(_load_reranker())
     logger.info("Reranker model loaded successfully")
 except Exception as e:
     logger.error(f"Failed to load reranker model: {e}")
     reranker_model = None
 
 
+# ============================================================================
+# RERANK SCORE CACHE
+# ============================================================================
+
+# Điểm cross-encoder theo hash của (query, text) - key theo nội dung nên FAQ/tài liệu
+# bị sửa sẽ tự miss, không cần invalidate
+RERANK_CACHE_SIZE = 50_000
+# Micro-batch cho các pair chưa cache - pair được sort theo độ dài trước khi chia batch
+RERANK_BATCH_SIZE = 16
+_rerank_cache = OrderedDict()
+_rerank_cache_lock = threading.Lock()
+
+
+def _pair_digest(query: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{query}\x00{text}".encode("utf-8"), digest_size=16).digest()
+
+
+def _predict_cached(pairs: List[List[str]]) -> np.ndarray:
+    """Cross-encoder predict chỉ cho các pair chưa có trong cache, sort theo độ dài rồi chia micro-batch RERANK_BATCH_SIZE"""
+    keys = [_pair_digest(query, text) for query, text in pairs]
+    scores = np.empty(len(pairs), dtype=np.float32)
+    missing = []
+
+    with _rerank_cache_lock:
+        for i, key in enumerate(keys):
+            cached = _rerank_cache.get(key)
+            if cached is None:
+                missing.append(i)
+            else:
+                _rerank_cache.move_to_end(key)
+                scores[i] = cached
+
+    if missing:
+        # Sort theo độ dài: mỗi batch pad tới pair dài nhất của chính nó, không phải của cả K
+        missing.sort(key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+        predicted = reranker_model.predict(
+            [pairs[i] for i in missing], batch_size=RERANK_BATCH_SIZE, show_progress_bar=False
+        )
+        with _rerank_cache_lock:
+            for i, score in zip(missing, predicted):
+                scores[i] = score
+                _rerank_cache[keys[i]] = float(score)
+            while len(_rerank_cache) > RERANK_CACHE_SIZE:
+                _rerank_cache.popitem(last=False)
+
+    logger.debug("Rerank cache: %d/%d pairs hit", len(pairs) - len(missing), len(pairs))
+    return scores
+
+
 # ============================================================================
 # FAQ RERANKING (OPTIMIZED)
 # ============================================================================
 
+# Thứ tự các variant khi rerank FAQ (khớp với thứ tự trọng số)
+_FAQ_VARIANTS = ('question_only', 'question_answer', 'answer_only')
+
+
 @tool
 def rerank_faq(query: str, faq_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Rerank FAQ results using cross-encoder với chiến lược tối ưu.
     """
+    return _rerank_faq_candidates(query, faq_results)
+
+
+def _rerank_faq_candidates(query: str, faq_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Rerank FAQ candidates (dùng chung cho rerank_faq và search_and_rerank)"""
     try:
         if not faq_results:
             logger.warning("No FAQ to rerank")
@@ -38,9 +209,10 @@ def rerank_faq(query: str, faq_results: List[Dict[str, Any]]) -> List[Dict[str,
             logger.warning("Reranker model not available, returning original FAQ")
             return faq_results
 
-        # Prepare pairs với nhiều variants
+        # Prepare pairs với nhiều variants - mỗi FAQ hợp lệ đúng 3 pairs liên tiếp
+        # theo thứ tự _FAQ_VARIANTS để reshape thành ma trận (n_faq, 3)
         pairs = []
-        faq_variants = []
+        kept_idx = []
 
         for idx, faq in enumerate(faq_results):
             question = faq.get('question', '').strip()
@@ -49,69 +221,43 @@ def rerank_faq(query: str, faq_results: List[Dict[str, Any]]) -> List[Dict[str,
             if not question:
                 continue
 
-            # Variant 1: Query vs Question only
-            pairs.append([query, question])
-            faq_variants.append(('question_only', idx))
-
-            # Variant 2: Query vs Question+Answer
-            combined = f"{question} {answer}"
-            pairs.append([query, combined])
-            faq_variants.append(('question_answer', idx))
-
-            # Variant 3: Query vs Answer only
-            pairs.append([query, answer])
-            faq_variants.append(('answer_only', idx))
+            kept_idx.append(idx)
+            pairs.append([query, question])  # Variant 1: Query vs Question only
+            pairs.append([query, f"{question} {answer}"])  # Variant 2: Query vs Question+Answer
+            pairs.append([query, answer])  # Variant 3: Query vs Answer only
 
         if not pairs:
             logger.warning("No valid FAQ pairs created")
             return faq_results
 
-        # Predict scores
+        # Pairs chưa có trong cache chạy theo micro-batch (xem _predict_cached)
         logger.info(f"Reranking {len(pairs)} FAQ variants ({len(faq_results)} FAQs)")
-        scores = reranker_model.predict(pairs)
-
-        # Aggregate scores
-        faq_scores = {}
-        for i, (variant_type, faq_idx) in enumerate(faq_variants):
-            if faq_idx not in faq_scores:
-                faq_scores[faq_idx] = {}
-            faq_scores[faq_idx][variant_type] = float(scores[i])
-
-        # Calculate final scores với weighted average
-        weights = {
-            'question_only': getattr(settings, 'FAQ_QUESTION_WEIGHT', 0.5),
-            'question_answer': getattr(settings, 'FAQ_QA_WEIGHT', 0.3),
-            'answer_only': getattr(settings, 'FAQ_ANSWER_WEIGHT', 0.2)
-        }
+        scores = _predict_cached(pairs)
 
-        reranked_faq = []
-        for faq_idx, faq in enumerate(faq_results):
-            if faq_idx not in faq_scores:
-                continue
+        # SoA: ma trận điểm (n_faq, 3) → weighted sum + consistency bonus bằng NumPy
+        variant_matrix = np.asarray(scores, dtype=np.float64).reshape(-1, len(_FAQ_VARIANTS))
+        weights = np.array([
+            getattr(settings, 'FAQ_QUESTION_WEIGHT', 0.5),
+            getattr(settings, 'FAQ_QA_WEIGHT', 0.3),
+            getattr(settings, 'FAQ_ANSWER_WEIGHT', 0.2)
+        ])
+        final_scores = variant_matrix @ weights
 
-            variant_scores = faq_scores[faq_idx]
+        consistency_threshold = getattr(settings, 'FAQ_CONSISTENCY_THRESHOLD', 0.6)
+        consistent = np.all(variant_matrix > consistency_threshold, axis=1)
+        final_scores[consistent] *= getattr(settings, 'FAQ_CONSISTENCY_BONUS', 1.1)
 
-            final_score = sum(
-                variant_scores.get(variant, 0) * weight
-                for variant, weight in weights.items()
-            )
+        # Sort by final score (stable, giảm dần)
+        order = np.argsort(-final_scores, kind='stable')
 
-            # Bonus for consistent high scores
-            consistency_threshold = getattr(settings, 'FAQ_CONSISTENCY_THRESHOLD', 0.6)
-            if all(variant_scores.get(v, 0) > consistency_threshold for v in weights.keys()):
-                bonus = getattr(settings, 'FAQ_CONSISTENCY_BONUS', 1.1)
-                final_score *= bonus
-                logger.debug(f"FAQ {faq_idx} received consistency bonus")
-
-            faq_copy = faq.copy()
-            faq_copy['rerank_score'] = final_score
-            faq_copy['rerank_details'] = variant_scores
+        reranked_faq = []
+        for row in order:
+            faq_copy = faq_results[kept_idx[row]].copy()
+            faq_copy['rerank_score'] = float(final_scores[row])
+            faq_copy['rerank_details'] = dict(zip(_FAQ_VARIANTS, variant_matrix[row].tolist()))
             reranked_faq.append(faq_copy)
 
-        # Sort by final score
-        reranked_faq.sort(key=lambda x: x.get('rerank_score', 0), reverse=True)
-
-        logger.info(f"Reranked {len(reranked_faq)} FAQs. Best: {reranked_faq[0].get('rerank_score', 0):.3f}")
+        logger.info(f"Reranked {len(reranked_faq)} FAQs. Best: {reranked_faq[0]['rerank_score']:.3f}")
 
         return reranked_faq
 
@@ -144,8 +290,8 @@ def rerank_documents(query: str, documents: List[Dict[str, Any]]) -> List[Dict[s
             doc_text = doc.get('description', '') or doc.get('answer', '') or ''
             pairs.append([query, doc_text])
 
-        # Predict scores
-        scores = reranker_model.predict(pairs)
+        # Predict scores - pairs chưa cache chạy theo micro-batch (xem _predict_cached)
+        scores = _predict_cached(pairs)
 
         # Add rerank_score
         reranked_docs = []
@@ -204,6 +350,60 @@ def safe_encode_and_fix_dimension(query: str, target_collection: str, target_fie
         raise
 
 
+# ============================================================================
+# SEMANTIC SEARCH CACHE
+# ============================================================================
+
+class _SemanticSearchCache:
+    """
+    Cache kết quả search theo embedding câu hỏi: câu hỏi gần trùng (cosine >= threshold)
+    dùng lại kết quả Milvus. Ring buffer NumPy (capacity x dim) - evict FIFO, TTL cho dữ liệu cũ
+    """
+
+    def __init__(self, capacity: int = 2048, threshold: float = 0.97, ttl: float = 300):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self._vectors = None
+        self._entries = [None] * capacity
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def get(self, vector: np.ndarray) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            if not self._size or self._vectors.shape[1] != vector.shape[0]:
+                return None
+            sims = self._vectors[:self._size] @ vector.astype(np.float32, copy=False)
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            expires_at, results = self._entries[best]
+            if expires_at < time.monotonic():
+                return None
+            return [dict(result) for result in results]
+
+    def put(self, vector: np.ndarray, results: List[Dict[str, Any]]):
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+                self._size = 0
+                self._next = 0
+            self._vectors[self._next] = vector
+            self._entries[self._next] = (time.monotonic() + self.ttl, [dict(result) for result in results])
+            self._next = (self._next + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._next = 0
+            self._entries = [None] * self.capacity
+
+
+_document_search_cache = _SemanticSearchCache()
+
+
 @tool
 def search_documents(query: str) -> List[Dict[str, Any]]:
     """Tìm kiếm tài liệu liên quan đến câu hỏi"""
@@ -214,7 +414,14 @@ def search_documents(query: str) -> List[Dict[str, Any]]:
             "description_vector"
         )
 
+        cached = _document_search_cache.get(query_vector)
+        if cached is not None:
+            logger.info("⚡ Document search semantic cache hit")
+            return cached
+
         results = milvus_client.search_documents(query_vector, settings.TOP_K)
+        if results:
+            _document_search_cache.put(query_vector, results)
         return results
 
     except Exception as e:
@@ -227,6 +434,11 @@ def search_faq(query: str, top_k: int = None) -> List[Dict[str, Any]]:
     """
     Tìm kiếm FAQ với top_k cao hơn để reranking có nhiều lựa chọn
     """
+    return _search_faq_candidates(query, top_k)
+
+
+def _search_faq_candidates(query: str, top_k: int = None) -> List[Dict[str, Any]]:
+    """ANN search FAQ (dùng chung cho search_faq và search_and_rerank)"""
     try:
         if top_k is None:
             top_k = getattr(settings, 'FAQ_TOP_K', 10)
@@ -247,13 +459,92 @@ def search_faq(query: str, top_k: int = None) -> List[Dict[str, Any]]:
         return [{"error": f"Lỗi tìm kiếm FAQ: {str(e)}"}]
 
 
+def scores_array(results: List[Dict[str, Any]], key: str) -> np.ndarray:
+    """Lấy một trường điểm của danh sách kết quả thành mảng float32 (thiếu → 0)"""
+    return np.fromiter(
+        (item.get(key, 0) for item in results),
+        dtype=np.float32,
+        count=len(results)
+    )
+
+
+def _filter_by_similarity(faq_results: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    """Lọc FAQ theo similarity bằng một phép so sánh vector, giữ nguyên thứ tự"""
+    scores = scores_array(faq_results, "similarity_score")
+    return [faq_results[i] for i in np.flatnonzero(scores >= np.float32(threshold))]
+
+
+@tool
+def search_and_rerank(
+        query: str,
+        vector_threshold: float,
+        top_k: int = None,
+        skip_rerank_above: float = None,
+        rerank_top_k: int = None
+) -> List[Dict[str, Any]]:
+    """
+    Search FAQ + lọc theo vector_threshold + rerank trong một lần gọi tool.
+    Trả về FAQ đã rerank (có cả similarity_score và rerank_score), [] nếu không FAQ nào
+    qua ngưỡng, hoặc [{"error": ...}] nếu search lỗi.
+    Nếu similarity cao nhất >= skip_rerank_above thì bỏ qua cross-encoder,
+    rerank_score = similarity_score. Chỉ rerank_top_k FAQ similarity cao nhất được rerank.
+    """
+    faq_results = _search_faq_candidates(query, top_k)
+
+    if not faq_results or "error" in faq_results[0]:
+        return faq_results
+
+    filtered_faqs = _filter_by_similarity(faq_results, vector_threshold)
+    if not filtered_faqs:
+        return []
+
+    logger.info(f"{len(filtered_faqs)}/{len(faq_results)} FAQs above vector threshold {vector_threshold}")
+
+    if skip_rerank_above is not None:
+        by_similarity = sorted(filtered_faqs, key=lambda x: x.get('similarity_score', 0), reverse=True)
+        if by_similarity[0].get('similarity_score', 0) >= skip_rerank_above:
+            logger.info(f"Top similarity >= {skip_rerank_above}, skip rerank")
+            return [
+                {**faq, 'rerank_score': faq.get('similarity_score', 0), 'rerank_skipped': True}
+                for faq in by_similarity
+            ]
+
+    return _rerank_faq_candidates(query, top_by_similarity(filtered_faqs, rerank_top_k))
+
+
+def top_by_similarity(results: List[Dict[str, Any]], k: int = None) -> List[Dict[str, Any]]:
+    """Giữ k kết quả similarity cao nhất trước khi rerank (O(n log k)); k=None → giữ nguyên"""
+    if k is None or len(results) <= k:
+        return results
+    return heapq.nlargest(k, results, key=lambda x: x.get('similarity_score', 0))
+
+
 # ============================================================================
 # DATABASE CONNECTION CHECK
 # ============================================================================
 
+# Trạng thái DB hiếm khi đổi giữa các request - dùng lại kết quả probe trong DB_STATUS_TTL giây
+DB_STATUS_TTL = 5.0
+_db_status_cache = (0.0, None)
+_db_status_lock = threading.Lock()
+
+
 @tool
 def check_database_connection() -> Dict[str, Any]:
     """Kiểm tra kết nối cơ sở dữ liệu"""
+    global _db_status_cache
+
+    # Giữ lock trong lúc probe: request đồng thời chờ một lần probe thay vì cùng gọi Milvus
+    with _db_status_lock:
+        expires_at, status = _db_status_cache
+        if status is None or expires_at < time.monotonic():
+            status = _check_database_connection_uncached()
+            _db_status_cache = (time.monotonic() + DB_STATUS_TTL, status)
+
+    return dict(status)
+
+
+def _check_database_connection_uncached() -> Dict[str, Any]:
     try:
         is_connected = milvus_client.check_connection()
 
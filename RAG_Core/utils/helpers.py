@@ -1,6 +1,8 @@
+import keyword
 import logging
 import time
 from functools import wraps
+from string import Formatter
 from typing import Any, Callable, Dict, List
 import json
 
@@ -26,6 +28,72 @@ def timing_decorator(func: Callable) -> Callable:
     return wrapper
 
 
+def compile_prompt(template: str) -> Callable[..., str]:
+    """
+    Tách template kiểu str.format một lần và sinh sẵn hàm render(**values)
+    dạng "".join((literal, value, ...)) - không parse template / không vòng lặp mỗi lần gọi
+    """
+    parts = [(literal, field, spec) for literal, field, spec, _ in Formatter().parse(template)]
+
+    fields = []
+    pieces = []
+    for literal, field, spec in parts:
+        if literal:
+            pieces.append(repr(literal))
+        if field is None:
+            continue
+        if not field.isidentifier() or keyword.iskeyword(field) or field in ("str", "format"):
+            return _render_parts(parts)
+        if field not in fields:
+            fields.append(field)
+        pieces.append(f"format({field}, {spec!r})" if spec else f"str({field})")
+
+    signature = ", ".join(["*", *fields, "**_unused"] if fields else ["**_unused"])
+    body = ", ".join(pieces) if pieces else "''"
+    source = f'def render({signature}):\n    return "".join(({body},))\n'
+    namespace = {}
+    exec(compile(source, "<prompt-template>", "exec"), namespace)
+    return namespace["render"]
+
+
+def _render_parts(parts: List[tuple]) -> Callable[..., str]:
+    """Fallback cho template có field không phải identifier (vd. {0}, {a.b})"""
+
+    def render(**values) -> str:
+        pieces = []
+        for literal, field, spec in parts:
+            pieces.append(literal)
+            if field is not None:
+                pieces.append(format(values[field], spec))
+        return "".join(pieces)
+
+    return render
+
+
+def is_short_answer(text: str, min_length: int = 10) -> bool:
+    """
+    Tương đương `not text or len(text.strip()) < min_length` nhưng chỉ strip
+    (copy cả chuỗi) khi hai đầu có khoảng trắng
+    """
+    if not text or len(text) < min_length:
+        return True
+    if not text[0].isspace() and not text[-1].isspace():
+        return False
+    return len(text.strip()) < min_length
+
+
+def normalize_history(history: List = None) -> List[Dict[str, str]]:
+    """Chuẩn hóa history (dict / ChatMessage) về list dict {"role", "content"} - gọi một lần ở đầu workflow"""
+    if not history:
+        return []
+
+    return [
+        msg if type(msg) is dict or type(msg) is str
+        else {"role": getattr(msg, "role", ""), "content": getattr(msg, "content", "")}
+        for msg in history
+    ]
+
+
 def safe_execute(func: Callable, default_value: Any = None, log_errors: bool = True) -> Any:
     """Safely execute a function with error handling"""
     try:
@@ -13,17 +13,26 @@ from agents.retriever_agent import RetrieverAgent
 from agents.grader_agent import GraderAgent
 from agents.generator_agent import GeneratorAgent
 from agents.reporter_agent import ReporterAgent
+from utils.helpers import normalize_history
 
 # Import streaming agents
 from agents.base_agent import (
     StreamingChatterAgent,
     StreamingOtherAgent,
-    StreamingNotEnoughInfoAgent
+    StreamingNotEnoughInfoAgent,
+    SUPPORT_REFERENCES,
+    GENERAL_KNOWLEDGE_REFERENCES
 )
 
 logger = logging.getLogger(__name__)
 
 
+async def _static_stream(text: str) -> AsyncIterator[str]:
+    """Answer đã có sẵn (FAQ direct, REPORTER) - gửi ngay một chunk, giữ nguyên xuống dòng"""
+    if text:
+        yield text
+
+
 class ChatbotState(TypedDict):
     question: str
     original_question: str
@@ -61,13 +70,15 @@ class RAGWorkflow:
 
         self.executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="RAG-Worker")
         self.workflow = self._create_workflow()
+        # Cùng graph nhưng bước song song chạy async (ainvoke) - không tranh 3 worker của executor
+        self.async_workflow = self._create_workflow(self._aparallel_execution_node)
 
-    def _create_workflow(self):
+    def _create_workflow(self, parallel_node=None):
         """Tạo workflow graph"""
         workflow = StateGraph(ChatbotState)
 
         # Add nodes
-        workflow.add_node("parallel_execution", self._parallel_execution_node)
+        workflow.add_node("parallel_execution", parallel_node or self._parallel_execution_node)
         workflow.add_node("decision_router", self._decision_router_node)
         workflow.add_node("grader", self._grader_node)
         workflow.add_node("generator", self._generator_node)
@@ -145,6 +156,51 @@ class RAGWorkflow:
 
         return state
 
+    async def _aparallel_execution_node(self, state: ChatbotState) -> ChatbotState:
+        """Async version: Supervisor + FAQ + RETRIEVER gather trên event loop, không chặn loop"""
+        question = state["question"]
+        history = state.get("history", [])
+
+        logger.info("🚀 Starting async parallel execution")
+
+        supervisor_result, faq_result, retriever_result = await asyncio.gather(
+            self._await_with_timeout(
+                asyncio.to_thread(self._safe_execute_supervisor, question, history), timeout=20,
+                default={"agent": "FAQ", "contextualized_question": question, "is_followup": False},
+                name="Supervisor"
+            ),
+            self._await_with_timeout(
+                self._safe_aexecute_faq(question, history), timeout=10,
+                default={"status": "ERROR", "answer": "", "references": []},
+                name="FAQ"
+            ),
+            self._await_with_timeout(
+                asyncio.to_thread(self._safe_execute_retriever, question), timeout=10,
+                default={"status": "ERROR", "documents": []},
+                name="RETRIEVER"
+            )
+        )
+
+        state["supervisor_classification"] = supervisor_result
+        state["question"] = supervisor_result.get("contextualized_question", question)
+        state["is_followup"] = supervisor_result.get("is_followup", False)
+        state["context_summary"] = supervisor_result.get("context_summary", "")
+        state["faq_result"] = faq_result
+        state["retriever_result"] = retriever_result
+        state["parallel_mode"] = True
+
+        return state
+
+    async def _await_with_timeout(self, aw, timeout: float, default: Dict, name: str) -> Dict:
+        try:
+            return await asyncio.wait_for(aw, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⏱️ {name} timeout, using fallback")
+            return default
+        except Exception as e:
+            logger.error(f"❌ {name} error: {e}")
+            return default
+
     def _get_result_with_timeout(self, future, timeout: float, default: Dict, name: str) -> Dict:
         try:
             return future.result(timeout=timeout)
@@ -186,6 +242,13 @@ class RAGWorkflow:
             logger.error(f"FAQ error: {e}")
             return {"status": "ERROR", "answer": "", "references": [], "next_agent": "RETRIEVER"}
 
+    async def _safe_aexecute_faq(self, question: str, history: List) -> Dict[str, Any]:
+        try:
+            return await self.faq_agent.aprocess(question, is_followup=False, context="")
+        except Exception as e:
+            logger.error(f"FAQ error: {e}")
+            return {"status": "ERROR", "answer": "", "references": [], "next_agent": "RETRIEVER"}
+
     def _safe_execute_retriever(self, question: str) -> Dict[str, Any]:
         try:
             return self.retriever_agent.process(question)
@@ -338,6 +401,29 @@ class RAGWorkflow:
                 "status": "ERROR"
             }
 
+    async def arun(self, question: str, history: List[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Async non-streaming run: Supervisor + FAQ + RETRIEVER qua _aparallel_execution_node,
+        các request đồng thời không xếp hàng sau nhau trong self.executor
+        """
+        try:
+            initial_state = self._create_initial_state(question, history)
+            logger.info(f"🚀 Async workflow start: {question[:100]}")
+            final_state = await self.async_workflow.ainvoke(initial_state)
+
+            return {
+                "answer": final_state.get("answer", "Lỗi xử lý"),
+                "references": final_state.get("references", []),
+                "status": final_state.get("status", "ERROR")
+            }
+        except Exception as e:
+            logger.error(f"❌ Workflow error: {e}", exc_info=True)
+            return {
+                "answer": "Xin lỗi, hệ thống gặp sự cố.",
+                "references": [],
+                "status": "ERROR"
+            }
+
     async def run_with_streaming(
             self,
             question: str,
@@ -351,7 +437,7 @@ class RAGWorkflow:
 
             # Run parallel execution
             initial_state = self._create_initial_state(question, history)
-            state = self._parallel_execution_node(initial_state)
+            state = await self._aparallel_execution_node(initial_state)
             state = self._decision_router_node(state)
 
             current_agent = state.get("current_agent")
@@ -363,15 +449,8 @@ class RAGWorkflow:
             if current_agent == "end":
                 answer_text = state.get("answer", "")
 
-                async def faq_generator():
-                    # FAQ answers are pre-computed, so we fake stream
-                    words = answer_text.split()
-                    for word in words:
-                        yield word + " "
-                        await asyncio.sleep(0.01)
-
                 return {
-                    "answer_stream": faq_generator(),
+                    "answer_stream": _static_stream(answer_text),
                     "references": state.get("references", []),
                     "status": state.get("status", "SUCCESS")
                 }
@@ -380,7 +459,8 @@ class RAGWorkflow:
             # GRADER → GENERATOR (TRUE STREAMING)
             # ================================================================
             elif current_agent == "GRADER":
-                state = self._grader_node(state)
+                # Cross-encoder rerank là CPU-bound - chạy ngoài event loop
+                state = await asyncio.to_thread(self._grader_node, state)
 
                 if state.get("current_agent") == "GENERATOR":
                     logger.info("✅ TRUE STREAMING: GENERATOR")
@@ -389,7 +469,7 @@ class RAGWorkflow:
                             question=state["question"],
                             documents=state.get("qualified_documents", []),
                             references=state.get("references", []),
-                            history=history or [],
+                            history=state.get("history", []),
                             is_followup=state.get("is_followup", False),
                             context_summary=state.get("context_summary", "")
                         ),
@@ -400,14 +480,11 @@ class RAGWorkflow:
                     # NOT_ENOUGH_INFO - TRUE STREAMING
                     logger.info("✅ TRUE STREAMING: NOT_ENOUGH_INFO")
 
-                    from config.settings import settings
-
                     return {
                         "answer_stream": self.not_enough_info_agent.process_streaming(
-                            question=state["question"],
-                            support_phone=settings.SUPPORT_PHONE
+                            question=state["question"]
                         ),
-                        "references": [{"document_id": "llm_knowledge", "type": "GENERAL_KNOWLEDGE"}],
+                        "references": GENERAL_KNOWLEDGE_REFERENCES,
                         "status": "STREAMING"
                     }
 
@@ -417,15 +494,12 @@ class RAGWorkflow:
             elif current_agent == "CHATTER":
                 logger.info("✅ TRUE STREAMING: CHATTER")
 
-                from config.settings import settings
-
                 return {
                     "answer_stream": self.chatter_agent.process_streaming(
                         question=state["question"],
-                        history=state.get("history", []),
-                        support_phone=settings.SUPPORT_PHONE
+                        history=state.get("history", [])
                     ),
-                    "references": [{"document_id": "support_contact", "type": "SUPPORT"}],
+                    "references": SUPPORT_REFERENCES,
                     "status": "STREAMING"
                 }
 
@@ -435,12 +509,9 @@ class RAGWorkflow:
             elif current_agent == "OTHER":
                 logger.info("✅ TRUE STREAMING: OTHER")
 
-                from config.settings import settings
-
                 return {
                     "answer_stream": self.other_agent.process_streaming(
-                        question=state["question"],
-                        support_phone=settings.SUPPORT_PHONE
+                        question=state["question"]
                     ),
                     "references": [],
                     "status": "STREAMING"
@@ -451,17 +522,11 @@ class RAGWorkflow:
             # ================================================================
             elif current_agent == "REPORTER":
                 logger.info("📋 REPORTER: Static message")
-                state = self._reporter_node(state)
+                state = await asyncio.to_thread(self._reporter_node, state)
                 answer_text = state.get("answer", "")
 
-                async def reporter_generator():
-                    words = answer_text.split()
-                    for word in words:
-                        yield word + " "
-                        await asyncio.sleep(0.01)
-
                 return {
-                    "answer_stream": reporter_generator(),
+                    "answer_stream": _static_stream(answer_text),
                     "references": state.get("references", []),
                     "status": state.get("status", "SUCCESS")
                 }
@@ -498,7 +563,7 @@ class RAGWorkflow:
         return ChatbotState(
             question=question,
             original_question=question,
-            history=history or [],
+            history=normalize_history(history),
             is_followup=False,
             context_summary="",
             relevant_context="",